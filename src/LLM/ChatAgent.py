@@ -1,17 +1,24 @@
+import asyncio
 import fcntl
+import time
+import uuid
+import httpx
 import requests
 import json
 import pickle
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 from tenacity import (
+    AsyncRetrying,
     retry,
+    retry_if_exception,
     retry_if_exception_type,
     stop_after_attempt,
     wait_exponential,
 )
 from tqdm import tqdm
+from dataclasses import dataclass, fields
 from pathlib import Path
+from typing import Callable, Optional
 import logging
 
 from src.configs.config import (
@@ -21,24 +28,107 @@ from src.configs.config import (
     BASE_DIR,
     OUTPUT_DIR,
     DEFAULT_CHATAGENT_MODEL,
-    CHAT_AGENT_WORKERS
+    CHAT_AGENT_WORKERS,
+    CHAT_AGENT_MAX_RETRIES,
+    CHAT_AGENT_MAX_RATE_LIMIT_WAITS,
+    CHAT_AGENT_BATCH_API_ENABLED,
+    CHAT_AGENT_BATCH_URL,
+    CHAT_AGENT_BATCH_MODEL,
+    CHAT_AGENT_BATCH_MIN_PROMPTS,
+    CHAT_AGENT_BATCH_POLL_INTERVAL,
+    CHAT_AGENT_BATCH_TIMEOUT,
+    CHAT_AGENT_BATCH_DIR,
+    CHAT_CACHE_ENABLED,
+    LOCAL_WORKERS
 )
+from src.LLM.async_client import get_runtime
+from src.LLM.file_registry import get_file_registry
+from src.LLM.json_utils import JSONParseError, parse_json, response_format
+from src.LLM.ledger import get_ledger
+from src.LLM.local_backend import get_local_backend
+from src.LLM.response_cache import ResponseCache, get_response_cache
+from src.LLM.router import Route, get_route
+from src.LLM.utils import file_sha256
 
 logger = logging.getLogger(__name__)
 
+RETRYABLE_HTTP_ERRORS = (
+    httpx.HTTPStatusError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+
+def is_retryable_http_error(e:BaseException) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        status_code = e.response.status_code
+        return status_code >= 500 or status_code in (408, 409, 429)
+    return isinstance(e, RETRYABLE_HTTP_ERRORS)
+
+def is_missing_file_error(response:httpx.Response, file_ids) -> bool:
+    # Only errors about the attached files (deleted or expired ids) are worth a re-upload;
+    # context-length, schema and other request errors would fail again with fresh ids.
+    try:
+        error = response.json().get("error") or {}
+    except (ValueError, AttributeError):
+        error = {}
+    if not isinstance(error, dict):
+        error = {"message": str(error)}
+    code = f"{error.get('code') or ''} {error.get('type') or ''} {error.get('param') or ''}".lower()
+    message = str(error.get("message") or "").lower()
+    if "file" in code and ("not_found" in code or "expired" in code):
+        return True
+    if any(file_id.lower() in message for file_id in file_ids):
+        return True
+    return "file" in message and any(word in message for word in ("not found", "expired", "does not exist", "no such"))
+
+# Result of a single-flight future whose leading request was cancelled.
+LEADER_CANCELLED = object()
+
+def group_duplicates(items):
+    # Indices of equal items, grouped in first-seen order.
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item, []).append(i)
+    return list(groups.values())
+
+def fan_out(res_l, groups):
+    for group in groups.values():
+        for i in group[1:]:
+            res_l[i] = res_l[group[0]]
+    return res_l
+
+@dataclass
+class StreamStats:
+    ttft: Optional[float] = None
+    elapsed: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    tokens_per_sec: float = 0.0
+    aborted: bool = False
+
+    def reset(self):
+        for f in fields(self):
+            setattr(self, f.name, f.default)
 
 
 class ChatAgent:
-    def __init__(self, token:str = TOKEN, remote_url:str = REMOTE_URL, local_url:str = LOCAL_URL, files_url:str = None):
+    def __init__(self, token:str = TOKEN, remote_url:str = REMOTE_URL, local_url:str = LOCAL_URL, files_url:str = None, enable_cache:bool = CHAT_CACHE_ENABLED, batches_url:str = CHAT_AGENT_BATCH_URL):
         self.remote_url = remote_url
         self.token = token
         self.local_url = local_url
         self.files_url = files_url if files_url is not None else "https://api.openai.com/v1/files"
+        self.batches_url = batches_url
         self.header = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {token}",
         }
+        if token:
+            self.header["Authorization"] = f"Bearer {token}"
         self.batch_workers = CHAT_AGENT_WORKERS
+        self.cache = get_response_cache() if enable_cache else None
+        self.runtime = get_runtime()
+        self.file_registry = get_file_registry()
+        self.ledger = get_ledger()
     
     @retry(
         stop=stop_after_attempt(3),
@@ -46,7 +136,7 @@ class ChatAgent:
         retry=retry_if_exception_type(requests.RequestException),
     )
     def upload_file(self, pdf_path, purpose="assistants"):
-        headers = {"Authorization": f"Bearer {self.token}"}
+        headers = {k: v for k, v in self.header.items() if k != "Content-Type"}
         try:
             with open(pdf_path, "rb") as f:
                 files = {"file": (os.path.basename(pdf_path), f, "application/pdf")}
@@ -66,14 +156,106 @@ class ChatAgent:
             raise
     
         
+    async def aupload_file(self, pdf_path, purpose="assistants"):
+        registry = self.file_registry
+        digest = await asyncio.to_thread(file_sha256, pdf_path)
+        key = registry.make_key(digest, self.files_url, purpose)
+        file_id = await asyncio.to_thread(registry.get, key)
+        if file_id is not None:
+            return file_id
+        if key in registry.inflight:
+            return await asyncio.shield(registry.inflight[key])
+        future = asyncio.get_running_loop().create_future()
+        registry.inflight[key] = future
+        try:
+            file_id = await asyncio.to_thread(self.upload_file, pdf_path, purpose)
+            await asyncio.to_thread(registry.put, key, file_id, pdf_path)
+            future.set_result(file_id)
+            return file_id
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            registry.inflight.pop(key, None)
+
     @retry(
-        stop=stop_after_attempt(30),
-        wait=wait_exponential(min=1, max=300),
-        retry=retry_if_exception_type(requests.RequestException),
+        stop=stop_after_attempt(CHAT_AGENT_MAX_RETRIES),
+        wait=wait_exponential(min=1, max=60),
+        retry=retry_if_exception(is_retryable_http_error),
     )
-    def remote_chat(self, text_content, temperature:float = 0.5, model = DEFAULT_CHATAGENT_MODEL, pdf_paths=None):
-        url = self.remote_url
-        header = self.header
+    async def _apost_chat(self, payload, meta:dict = None):
+        meta = meta if meta is not None else {}
+        meta["attempts"] = meta.get("attempts", 0) + 1
+        limiter = self.runtime.rate_limiter
+        estimated_tokens = sum(len(m["content"]) for m in payload["messages"]) // 4
+        # 429s are absorbed by the shared limiter (all workers pause together) instead of
+        # each worker backing off on its own; only other failures go through tenacity.
+        for _ in range(CHAT_AGENT_MAX_RATE_LIMIT_WAITS):
+            await limiter.acquire(estimated_tokens)
+            async with self.runtime.semaphore:
+                response = await self.runtime.client.post(self.remote_url, headers=self.header, json=payload)
+            limiter.on_response(response.status_code, response.headers)
+            if response.status_code != 429:
+                break
+            meta["throttled"] = meta.get("throttled", 0) + 1
+        if response.status_code != 200:
+            logger.error(f"chat response code: {response.status_code}\n{response.text[:500]}, retrying...")
+            response.raise_for_status()
+        try:
+            usage = response.json().get("usage") or {}
+            limiter.settle(estimated_tokens, usage.get("total_tokens"))
+        except ValueError:
+            pass
+        return response.text
+
+    async def async_remote_chat(self, text_content, temperature:float = 0.5, model = DEFAULT_CHATAGENT_MODEL, pdf_paths=None, use_cache:bool = True, max_tokens:int = None, schema:dict = None):
+        if isinstance(pdf_paths, str):
+            pdf_paths = [pdf_paths]
+        stage = self.ledger.stage
+        if pdf_paths:
+            # Hashing the attached PDFs reads them from disk.
+            request_key = await asyncio.to_thread(
+                ResponseCache.make_key, model, temperature, text_content, pdf_paths, max_tokens, schema
+            )
+        else:
+            request_key = ResponseCache.make_key(model, temperature, text_content, pdf_paths, max_tokens, schema)
+        flight_key = f"{self.remote_url}|{request_key}"
+        inflight = self.runtime.inflight
+        while flight_key in inflight:
+            res_text = await asyncio.shield(inflight[flight_key])
+            if res_text is LEADER_CANCELLED:
+                # The request we joined was cancelled by its own caller; send it again.
+                continue
+            await self.ledger.arecord(model, cache_hit=True, kind="coalesced", stage=stage)
+            return res_text
+        future = asyncio.get_running_loop().create_future()
+        inflight[flight_key] = future
+        try:
+            res_text = await self._async_remote_chat(
+                text_content, temperature, model, pdf_paths, max_tokens, schema,
+                request_key if self.cache is not None and use_cache else None, stage
+            )
+            future.set_result(res_text)
+            return res_text
+        except asyncio.CancelledError:
+            # Waiters joined this request but were not cancelled themselves.
+            future.set_result(LEADER_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            inflight.pop(flight_key, None)
+
+    async def _async_remote_chat(self, text_content, temperature, model, pdf_paths, max_tokens, schema, cache_key, stage):
+        if cache_key is not None:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                await self.ledger.arecord(model, cache_hit=True, stage=stage)
+                return cached
+
         message = [{
             "role" : "user",
             "content" : text_content
@@ -83,90 +265,416 @@ class ChatAgent:
             "messages" : message,
             "temperature" : temperature
         }
-        if pdf_paths:
-            files_id = []
-            if isinstance(pdf_paths, str):
-                pdf_paths = [pdf_paths]
-            for pdf_path in pdf_paths:
-                file_id = self.upload_file(pdf_path)
-                files_id.append(file_id)
-            if files_id:
-                payload["file_ids"] = files_id
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if schema is not None and response_format(schema):
+            payload["response_format"] = response_format(schema)
+        meta = {}
+        start = time.monotonic()
+        for attempt in range(2):
+            if pdf_paths:
+                payload["file_ids"] = list(await asyncio.gather(
+                    *(self.aupload_file(pdf_path) for pdf_path in pdf_paths)
+                ))
+            try:
+                response_text = await self._apost_chat(payload, meta)
+                break
+            except httpx.HTTPStatusError as e:
+                if (
+                    attempt
+                    or not pdf_paths
+                    or e.response.status_code not in (400, 404)
+                    or not is_missing_file_error(e.response, payload["file_ids"])
+                ):
+                    raise
+                # A reused file id may have been deleted or expired on the provider side.
+                logger.warning(f"chat with file ids {payload['file_ids']} failed ({e.response.status_code}), re-uploading.")
+                for file_id in payload["file_ids"]:
+                    await asyncio.to_thread(self.file_registry.invalidate, file_id)
         
-        response = requests.post(url, headers=header, json=payload)
-        if response.status_code != 200:
-            logger.error(f"chat response code: {response.status_code}\n{response.text[:500]}, retrying...")
-            response.raise_for_status()
         try:
-            res = json.loads(response.text)
+            res = json.loads(response_text)
             res_text = res["choices"][0]["message"]["content"]
         except Exception as e:
             res_text = f"Error: {e}"
             logger.error(f"There is an error: {e}")
+            return res_text
+        usage = res.get("usage") or {}
+        await self.ledger.arecord(
+            model,
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens"),
+            time.monotonic() - start,
+            meta.get("attempts", 1) - 1 + meta.get("throttled", 0),
+            stage=stage,
+        )
+        if schema is not None:
+            res_text, valid = self.normalize_json(res_text, schema)
+            if not valid:
+                return res_text
+        if cache_key is not None:
+            await self.cache.aput(cache_key, res_text, model)
+        return res_text
+
+    @staticmethod
+    def normalize_json(res_text, schema):
+        # Near-valid JSON is repaired locally and re-serialised, so callers can json.loads()
+        # it directly; responses that still fail the schema are returned as-is (and never
+        # cached) for the caller's own retry or escalation.
+        try:
+            return json.dumps(parse_json(res_text, schema), ensure_ascii=False, indent=4), True
+        except JSONParseError as e:
+            logger.debug(f"response does not match schema: {e}")
+            return res_text, False
+
+    def remote_chat(self, text_content, temperature:float = 0.5, model = DEFAULT_CHATAGENT_MODEL, pdf_paths=None, use_cache:bool = True, max_tokens:int = None, route:str = None, validator:Callable[[str], bool] = None, schema:dict = None):
+        if route is not None:
+            route = get_route(route)
+            model, temperature, max_tokens = route.model, route.temperature, route.max_tokens
+        res_text = self.runtime.run(
+            self.async_remote_chat(text_content, temperature, model, pdf_paths, use_cache, max_tokens, schema)
+        )
+        if route is not None and route.escalate_to and validator is not None and not validator(res_text):
+            logger.info(f"response from {model} failed validation, escalating to {route.escalate_to}.")
+            res_text = self.runtime.run(
+                self.async_remote_chat(text_content, temperature, route.escalate_to, pdf_paths, use_cache, max_tokens, schema)
+            )
         return res_text
     
-    def _remote_chat(self, index, content, temperature:float = 0.5, model=DEFAULT_CHATAGENT_MODEL, pdf_paths=None):
-        return index, self.remote_chat(content, temperature, model, pdf_paths)
+    async def astream_remote_chat(self, text_content, temperature:float = 0.5, model = DEFAULT_CHATAGENT_MODEL, stats:StreamStats = None):
+        stats = stats if stats is not None else StreamStats()
+        payload = {
+            "model" : model,
+            "messages" : [{"role" : "user", "content" : text_content}],
+            "temperature" : temperature,
+            "stream" : True,
+            "stream_options" : {"include_usage" : True},
+        }
+        limiter = self.runtime.rate_limiter
+        estimated_tokens = len(text_content) // 4
+        await limiter.acquire(estimated_tokens)
+        start = time.monotonic()
+        chunks = 0
+        try:
+            async with self.runtime.semaphore:
+                async with self.runtime.client.stream("POST", self.remote_url, headers=self.header, json=payload) as response:
+                    limiter.on_response(response.status_code, response.headers)
+                    if response.status_code != 200:
+                        await response.aread()
+                        logger.error(f"chat response code: {response.status_code}\n{response.text[:500]}")
+                        response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if chunk.get("usage"):
+                            stats.prompt_tokens = chunk["usage"].get("prompt_tokens", 0)
+                            stats.completion_tokens = chunk["usage"].get("completion_tokens", 0)
+                            limiter.settle(estimated_tokens, chunk["usage"].get("total_tokens"))
+                        choices = chunk.get("choices") or []
+                        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                        if delta:
+                            if stats.ttft is None:
+                                stats.ttft = time.monotonic() - start
+                            chunks += 1
+                            yield delta
+        finally:
+            stats.elapsed = time.monotonic() - start
+            stats.completion_tokens = stats.completion_tokens or chunks
+            if stats.ttft is not None and stats.elapsed > stats.ttft:
+                stats.tokens_per_sec = stats.completion_tokens / (stats.elapsed - stats.ttft)
+
+    async def async_stream_remote_chat(self, text_content, temperature:float = 0.5, model = DEFAULT_CHATAGENT_MODEL, validator:Callable[[str], bool] = None, on_token:Callable[[str], None] = None, use_cache:bool = True, stats:StreamStats = None, validate_every:int = 8):
+        stats = stats if stats is not None else StreamStats()
+        stage = self.ledger.stage
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self.cache.make_key(model, temperature, text_content)
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                await self.ledger.arecord(model, cache_hit=True, kind="stream", stage=stage)
+                return cached
+
+        parts = []
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(CHAT_AGENT_MAX_RETRIES),
+            wait=wait_exponential(min=1, max=60),
+            # Tokens already handed to on_token cannot be taken back, so with a callback only
+            # failures before the first token are retried; without one the stream restarts.
+            retry=retry_if_exception(lambda e: (on_token is None or not parts) and is_retryable_http_error(e)),
+        )
+        async for attempt in retrying:
+            with attempt:
+                parts.clear()
+                stats.reset()
+                stream = self.astream_remote_chat(text_content, temperature, model, stats)
+                try:
+                    async for delta in stream:
+                        parts.append(delta)
+                        if on_token is not None:
+                            on_token(delta)
+                        # Closing the stream drops the connection, so the provider stops generating.
+                        if validator is not None and len(parts) % validate_every == 0 and not validator("".join(parts)):
+                            stats.aborted = True
+                            break
+                finally:
+                    await stream.aclose()
+        res_text = "".join(parts)
+        if not stats.aborted and validator is not None and not validator(res_text):
+            stats.aborted = True
+        logger.debug(
+            f"stream finished: ttft={stats.ttft}, tokens={stats.completion_tokens}, "
+            f"{stats.tokens_per_sec:.1f} tokens/s, aborted={stats.aborted}"
+        )
+        await self.ledger.arecord(
+            model, stats.prompt_tokens, stats.completion_tokens, stats.elapsed, kind="stream", stage=stage
+        )
+        if cache_key is not None and not stats.aborted:
+            await self.cache.aput(cache_key, res_text, model)
+        return res_text
+
+    def stream_remote_chat(self, text_content, temperature:float = 0.5, model = DEFAULT_CHATAGENT_MODEL, validator:Callable[[str], bool] = None, on_token:Callable[[str], None] = None, use_cache:bool = True, stats:StreamStats = None):
+        return self.runtime.run(
+            self.async_stream_remote_chat(text_content, temperature, model, validator, on_token, use_cache, stats)
+        )
     
-    def batch_remote_chat(self, prompt_l, desc: str = "batch_chating...", workers:int = CHAT_AGENT_WORKERS, temperature:float = 0.5, pdf_paths_list=None):
+    async def async_batch_remote_chat(self, prompt_l, desc: str = "batch_chating...", workers:int = CHAT_AGENT_WORKERS, temperature:float = 0.5, pdf_paths_list=None, use_cache:bool = True, model = DEFAULT_CHATAGENT_MODEL, max_tokens:int = None, schema:dict = None):
         if workers is None:
             workers = self.batch_workers
         if pdf_paths_list is None:
             pdf_paths_list = [None] * len(prompt_l)
         elif len(pdf_paths_list) != len(prompt_l):
             raise ValueError("pdf_paths_list长度必须与prompt_l相同")
-        with ThreadPoolExecutor(max_workers=workers) as executor:
-            future_l = [
-                executor.submit(self._remote_chat, i, prompt_l[i], temperature, DEFAULT_CHATAGENT_MODEL, pdf_paths_list[i])
-                for i in range(len(prompt_l))
-            ]
-            res_l = ["No Response"] * len(prompt_l)
+        batch_limiter = asyncio.Semaphore(workers)
+        groups = group_duplicates(
+            (prompt, tuple([pdf_paths] if isinstance(pdf_paths, str) else pdf_paths or ()))
+            for prompt, pdf_paths in zip(prompt_l, pdf_paths_list)
+        )
+        if len(groups) < len(prompt_l):
+            logger.debug(f"{desc}: {len(prompt_l) - len(groups)} duplicate prompts share a request.")
+
+        async def _remote_chat(group):
+            index = group[0]
+            async with batch_limiter:
+                resp = await self.async_remote_chat(
+                    prompt_l[index], temperature, model, pdf_paths_list[index], use_cache, max_tokens, schema
+                )
+            return group, resp
+
+        future_l = [asyncio.ensure_future(_remote_chat(group)) for group in groups]
+        res_l = ["No Response"] * len(prompt_l)
+        try:
             for future in tqdm(
-                as_completed(future_l),
+                asyncio.as_completed(future_l),
                 desc=desc,
                 total=len(future_l),
                 dynamic_ncols=True,
             ):
-                i, resp = future.result()
-                res_l[i] = resp
+                group, resp = await future
+                for i in group:
+                    res_l[i] = resp
+        finally:
+            for future in future_l:
+                future.cancel()
+        if self.cache is not None and use_cache:
+            logger.debug(f"response cache after {desc}: {await asyncio.to_thread(self.cache.stats)}")
         return res_l
-    
-    def local_chat(self, query):
-        query = """
-            <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-            You are a helpful AI assistant.<|eot_id|><|start_header_id|>user<|end_header_id|>
-            {}<|eot_id|><|start_header_id|>assistant<|end_header_id|>""".format(query)
-        payload = json.dumps(
+
+    def batch_remote_chat(self, prompt_l, desc: str = "batch_chating...", workers:int = CHAT_AGENT_WORKERS, temperature:float = 0.5, pdf_paths_list=None, use_cache:bool = True, prefer_batch_api:bool = False, model = None, max_tokens:int = None, route:str = None, validator:Callable[[str], bool] = None, schema:dict = None):
+        # The provider batch API takes its own model ids, not the chat endpoint's.
+        batch_model = model or CHAT_AGENT_BATCH_MODEL
+        model = model or DEFAULT_CHATAGENT_MODEL
+        if route is not None:
+            route = get_route(route)
+            model, temperature, max_tokens = route.model, route.temperature, route.max_tokens
+            batch_model = route.batch_model
+        if (
+            prefer_batch_api
+            and CHAT_AGENT_BATCH_API_ENABLED
+            and len(prompt_l) >= CHAT_AGENT_BATCH_MIN_PROMPTS
+            and not any(pdf_paths_list or [])
+        ):
+            res_l = self.batch_api_chat(
+                prompt_l, desc, temperature, batch_model, use_cache=use_cache, max_tokens=max_tokens, schema=schema,
+                workers=workers, fallback_model=model
+            )
+        else:
+            res_l = self.runtime.run(
+                self.async_batch_remote_chat(prompt_l, desc, workers, temperature, pdf_paths_list, use_cache, model, max_tokens, schema)
+            )
+        if route is not None and validator is not None:
+            res_l = self._escalate_failures(route, prompt_l, res_l, validator, desc, workers, pdf_paths_list, use_cache, schema)
+        return res_l
+
+    def _escalate_failures(self, route:Route, prompt_l, res_l, validator, desc, workers, pdf_paths_list, use_cache, schema = None):
+        failed = [i for i, res in enumerate(res_l) if not validator(res)]
+        if not failed or not route.escalate_to:
+            return res_l
+        logger.info(f"{desc} {len(failed)}/{len(res_l)} responses failed validation, escalating to {route.escalate_to}.")
+        retried = self.runtime.run(self.async_batch_remote_chat(
+            [prompt_l[i] for i in failed],
+            desc,
+            workers,
+            route.temperature,
+            [pdf_paths_list[i] for i in failed] if pdf_paths_list else None,
+            use_cache,
+            route.escalate_to,
+            route.max_tokens,
+            schema,
+        ))
+        for i, res in zip(failed, retried):
+            res_l[i] = res
+        return res_l
+
+    @staticmethod
+    def _write_batch_job(job_path, requests_l):
+        job_path.parent.mkdir(parents=True, exist_ok=True)
+        with job_path.open("w", encoding="utf-8") as f:
+            for request in requests_l:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    async def _aupload_batch_file(self, job_path):
+        headers = {k: v for k, v in self.header.items() if k != "Content-Type"}
+        content = await asyncio.to_thread(job_path.read_bytes)
+        response = await self.runtime.client.post(
+            self.files_url,
+            headers=headers,
+            files={"file": (job_path.name, content, "application/jsonl")},
+            data={"purpose": "batch"},
+        )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    async def _aread_batch_output(self, file_id):
+        response = await self.runtime.client.get(f"{self.files_url}/{file_id}/content", headers=self.header)
+        response.raise_for_status()
+        results, usages = {}, {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            body = (record.get("response") or {}).get("body") or {}
+            try:
+                results[record["custom_id"]] = body["choices"][0]["message"]["content"]
+                usages[record["custom_id"]] = body.get("usage") or {}
+            except (KeyError, IndexError, TypeError):
+                logger.error(f"batch request {record.get('custom_id')} failed: {record.get('error') or body}")
+        return results, usages
+
+    async def async_batch_api_chat(self, prompt_l, desc: str = "batch api chating...", temperature:float = 0.5, model:str = CHAT_AGENT_BATCH_MODEL, use_cache:bool = True, poll_interval:float = CHAT_AGENT_BATCH_POLL_INTERVAL, timeout:float = CHAT_AGENT_BATCH_TIMEOUT, max_tokens:int = None, schema:dict = None, workers:int = CHAT_AGENT_WORKERS, fallback_model:str = None):
+        # fallback_model is used for requests the batch leaves unanswered, which go to the chat endpoint.
+        res_l = ["No Response"] * len(prompt_l)
+        stage = self.ledger.stage
+        cache_keys = [None] * len(prompt_l)
+        groups = {group[0]: group for group in group_duplicates(prompt_l)}
+        pending = []
+        for i in groups:
+            if self.cache is not None and use_cache:
+                cache_keys[i] = self.cache.make_key(model, temperature, prompt_l[i], max_tokens=max_tokens, schema=schema)
+                cached = await self.cache.aget(cache_keys[i])
+                if cached is not None:
+                    res_l[i] = cached
+                    await self.ledger.arecord(model, cache_hit=True, kind="batch", stage=stage)
+                    continue
+            pending.append(i)
+        if not pending:
+            return fan_out(res_l, groups)
+
+        job_path = CHAT_AGENT_BATCH_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}.jsonl"
+        await asyncio.to_thread(self._write_batch_job, job_path, [
             {
-                "prompt" : query,
-                "temperature" : 1.0,
-                "max_token" : 102400,
-                "n" : 1
+                "custom_id": f"request-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": [{"role": "user", "content": prompt_l[i]}],
+                    "temperature": temperature,
+                    **({"max_tokens": max_tokens} if max_tokens is not None else {}),
+                    **({"response_format": response_format(schema)} if schema is not None and response_format(schema) else {}),
+                },
             }
+            for i in pending
+        ])
+
+        results, usages = {}, {}
+        start = time.monotonic()
+        try:
+            input_file_id = await self._aupload_batch_file(job_path)
+            response = await self.runtime.client.post(
+                self.batches_url,
+                headers=self.header,
+                json={
+                    "input_file_id": input_file_id,
+                    "endpoint": "/v1/chat/completions",
+                    "completion_window": "24h",
+                },
+            )
+            response.raise_for_status()
+            batch = response.json()
+            logger.info(f"{desc} submitted batch {batch['id']} with {len(pending)} requests ({job_path}).")
+            deadline = time.monotonic() + timeout
+            while batch.get("status") not in ("completed", "failed", "expired", "cancelled"):
+                if time.monotonic() > deadline:
+                    logger.error(f"batch {batch['id']} did not finish in {timeout}s, cancelling.")
+                    await self.runtime.client.post(f"{self.batches_url}/{batch['id']}/cancel", headers=self.header)
+                    break
+                await asyncio.sleep(poll_interval)
+                response = await self.runtime.client.get(f"{self.batches_url}/{batch['id']}", headers=self.header)
+                response.raise_for_status()
+                batch = response.json()
+                logger.debug(f"batch {batch['id']} status: {batch.get('status')} {batch.get('request_counts')}")
+            if batch.get("output_file_id"):
+                results, usages = await self._aread_batch_output(batch["output_file_id"])
+            if batch.get("status") != "completed":
+                logger.error(f"batch {batch['id']} ended with status {batch.get('status')}: {batch.get('errors')}")
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.error(f"batch api failed, falling back to interactive requests: {e}")
+
+        missing = []
+        for i in pending:
+            text = results.get(f"request-{i}")
+            if text is None:
+                missing.append(i)
+                continue
+            res_l[i] = text
+            usage = usages.get(f"request-{i}", {})
+            # The batch is one wall-clock wait, split evenly so stage totals stay additive.
+            await self.ledger.arecord(
+                model, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+                (time.monotonic() - start) / len(pending), kind="batch", stage=stage
+            )
+            if schema is not None:
+                text, valid = self.normalize_json(text, schema)
+                res_l[i] = text
+                if not valid:
+                    continue
+            if cache_keys[i] is not None:
+                await self.cache.aput(cache_keys[i], text, model)
+        if missing:
+            logger.warning(f"{len(missing)} of {len(pending)} batch requests missing, sending them interactively.")
+            fallback = await self.async_batch_remote_chat(
+                [prompt_l[i] for i in missing], desc=desc, workers=workers, temperature=temperature, use_cache=use_cache,
+                model=fallback_model or model, max_tokens=max_tokens, schema=schema
+            )
+            for i, text in zip(missing, fallback):
+                res_l[i] = text
+        return fan_out(res_l, groups)
+
+    def batch_api_chat(self, prompt_l, desc: str = "batch api chating...", temperature:float = 0.5, model:str = CHAT_AGENT_BATCH_MODEL, use_cache:bool = True, poll_interval:float = CHAT_AGENT_BATCH_POLL_INTERVAL, timeout:float = CHAT_AGENT_BATCH_TIMEOUT, max_tokens:int = None, schema:dict = None, workers:int = CHAT_AGENT_WORKERS, fallback_model:str = None):
+        return self.runtime.run(
+            self.async_batch_api_chat(prompt_l, desc, temperature, model, use_cache, poll_interval, timeout, max_tokens, schema, workers, fallback_model)
         )
-        headers = {
-            "Content-Type": "application/json"
-        }
-        res = requests.request("POST", self.local_url, headers=headers, data=payload)
-        if res.status_code != 200:
-            logger.info("chat response code: {}".format(res.status_code), query[:20])
-            return "chat response code: {}".format(res.status_code)
-        return res.json()["text"][0].replace(query, "")
-    
-    def _local_chat(self, index, query):
-        return index, self.local_chat(query)
     
-    def batch_local_chat(self, query_l, worker=16, desc="bach local inferencing..."):
-        with ThreadPoolExecutor(max_workers=worker) as executor:
-            future_l = [
-                executor.submit(self._local_chat, i, query_l[i])
-                for i in range(len(query_l))
-            ]
-            res_l = ["no response"] * len(query_l)
-            for future in tqdm(as_completed(future_l), desc=desc, total=len(future_l)):
-                i, resp = future.result()
-                res_l[i] = resp
-        return res_l
-    
-            
-        
\ No newline at end of file
+    @property
+    def local_backend(self):
+        return get_local_backend(self.local_url)
+
+    def local_chat(self, query, max_tokens:int = None, temperature:float = None):
+        return self.local_backend.generate([query], max_tokens, temperature)[0]
+
+    def batch_local_chat(self, query_l, worker=LOCAL_WORKERS, desc="bach local inferencing...", max_tokens:int = None, temperature:float = None):
+        return self.local_backend.generate(query_l, max_tokens, temperature, worker, desc)
@@ -2,101 +2,169 @@ import os
 import json
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import List
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 import logging
 
 from src.configs.config import (
-    DEFAULT_EMBED_ONLINE_MODEL,
-    DEFAULT_EMBED_LOCAL_MODEL,
     EMBED_REMOTE_URL,
-    EMBED_TOKEN
+    EMBED_TOKEN,
+    EMBED_REMOTE_MODEL,
+    EMBED_REMOTE_BATCH_SIZE,
+    EMBED_REMOTE_BATCH_TOKENS,
+    EMBED_REMOTE_WORKERS,
+    EMBED_REMOTE_MAX_RETRIES,
+    EMBED_REMOTE_TIMEOUT,
+    EMBED_PROCESSES,
+    EMBED_SHARD_MIN_TEXTS,
+    EMBED_CACHE_ENABLED
 )
+from src.LLM.embedding_cache import get_embedding_cache
+from src.LLM.embed_models import cache_model_name, get_embed_model, length_bucketed, shard_cache_name, sharded_embed
 
 logger = logging.getLogger(__name__)
 
+
 class EmbedAgent:
-    def __init__(self, token = EMBED_TOKEN, url = EMBED_REMOTE_URL):
+    def __init__(self, token = EMBED_TOKEN, url = EMBED_REMOTE_URL, enable_cache:bool = EMBED_CACHE_ENABLED):
         self.remote_url = url
         self.token = token
         self.header = {
             "Content-Type" : "application/json",
             "Authorization": f"Bearer {token}"
         }
+        self.cache = get_embedding_cache() if enable_cache else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max(EMBED_REMOTE_WORKERS, 16),
+            max_retries=Retry(
+                total=EMBED_REMOTE_MAX_RETRIES,
+                backoff_factor=1,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=None,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def local_embedding_model(self):
+        return get_embed_model()
+
+    def remote_embed(self, text:str, model:str = EMBED_REMOTE_MODEL):
+        embedding = self.batch_remote_embed([text], model=model, desc=None)[0]
+        return [] if np.isnan(embedding).any() else embedding.tolist()
+
+    def _post_embeddings(self, texts:List[str], model:str) -> List[list]:
+        payload = {"model": model, "input": texts, "encoding_format": "float"}
         try:
-            self.local_embedding_model = HuggingFaceEmbedding(
-                model_name = DEFAULT_EMBED_ONLINE_MODEL
-            )
-        except Exception as e:
-            logger.info("⚠加载远程嵌入模型失败，尝试加载本地嵌入模型！")
-            self.local_embedding_model = HuggingFaceEmbedding(
-                model_name = DEFAULT_EMBED_LOCAL_MODEL
-            )
-            
-    def remote_embed(self, text:str, max_retry:int = 15, model:str = "BAAI/bge-m3"):
-        url = self.remote_url
-        json_data = json.dumps({
-            "model" : model,
-            "input" : text,
-            "encoding_format" : "float"
-        })
-        try:
-            response = requests.post(url, headers=self.header, data=json_data)
-        except Exception as e:
-            logger.error("请求失败")
-            response = None
-            for attempt in range(max_retry):
-                try:
-                    response = requests.post(url, headers=self.header, data=json_data)
-                    if response.status_code == 200:
-                        logger.info(f"第{attempt + 1}次重复请求成功")
-                        break
-                except Exception as e:
-                    logger.error(f"第{attempt + 1}次重复请求失败")
-                    response = None
-                    
-        if response is None or response.status_code != 200:
-            return []
-    
+            response = self.session.post(self.remote_url, headers=self.header, json=payload, timeout=EMBED_REMOTE_TIMEOUT)
+        except requests.RequestException as e:
+            logger.error(f"嵌入请求失败: {e}")
+            return [[]] * len(texts)
+        if response.status_code != 200:
+            logger.error(f"embed response code: {response.status_code}\n{response.text[:500]}")
+            return [[]] * len(texts)
         try:
-            res = response.json()
-            embedding = res["data"][0]["embedding"]
-            return embedding
-        except json.JSONDecodeError as e:
+            data = response.json()["data"]
+        except (json.JSONDecodeError, KeyError) as e:
             logger.error(f"JSON解码失败: {e}")
-            return []
-        
-    
-    def remote_embed_task(self, index, text):
-        embedding = self.remote_embed(text)
-        return index, embedding
-    
-    def batch_remote_embed(self, texts, workers:int = 10, desc: str = "Batch Embedding..."):
-        embeddings = ["No Response"] * len(texts)
+            return [[]] * len(texts)
+        embeddings = [[]] * len(texts)
+        for i, item in enumerate(data):
+            embeddings[item.get("index", i)] = item["embedding"]
+        return embeddings
+
+    @staticmethod
+    def pack_batches(texts:List[str], batch_size:int = EMBED_REMOTE_BATCH_SIZE, batch_tokens:int = EMBED_REMOTE_BATCH_TOKENS) -> List[List[int]]:
+        # Greedy packing in input order, closing a batch when either the input count or the
+        # token budget would be exceeded; an oversized text still gets a batch of its own.
+        # Token counts are estimated at ~4 characters per token since the embedding tokenizer
+        # is server-side.
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            n_tokens = len(text) // 4 + 1
+            if current and (len(current) >= batch_size or current_tokens + n_tokens > batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += n_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _batch_remote_embed(self, texts:List[str], model:str, workers:int, desc:str) -> List[list]:
+        embeddings = [[]] * len(texts)
+        batches = self.pack_batches(texts)
         with ThreadPoolExecutor(max_workers=workers) as executor:
-            future_l = [
-                executor.submit(self.remote_embed_task, i, texts[i])
-                for i in range(len(texts))
-            ]
-            for future in tqdm(
-                as_completed(future_l),
-                desc=desc,
-                total=len(future_l),
-                dynamic_ncols=True,
-            ):
-                i, embedding = future.result()
-                embeddings[i] = embedding
-                
+            future_to_batch = {
+                executor.submit(self._post_embeddings, [texts[i] for i in batch], model): batch
+                for batch in batches
+            }
+            with tqdm(total=len(texts), desc=desc, dynamic_ncols=True, disable=desc is None) as pbar:
+                for future in as_completed(future_to_batch):
+                    batch = future_to_batch[future]
+                    for i, embedding in zip(batch, future.result()):
+                        embeddings[i] = embedding
+                    pbar.update(len(batch))
+        return embeddings
+
+    def batch_remote_embed(self, texts, workers:int = EMBED_REMOTE_WORKERS, desc:str = "Batch Embedding...", model:str = EMBED_REMOTE_MODEL) -> np.ndarray:
+        # Returns a contiguous (len(texts), dim) float32 array; rows that failed are NaN.
+        texts = list(texts)
+        compute = lambda missing: self._batch_remote_embed(missing, model, workers, desc)
+        if self.cache is None:
+            rows = compute(texts)
+        else:
+            rows = self.cache.get_or_compute(f"remote:{model}", texts, compute)
+        return self._to_matrix(rows, "remote")
+
+    @staticmethod
+    def _to_matrix(rows, kind:str) -> np.ndarray:
+        dim = next((len(row) for row in rows if row is not None and len(row)), 0)
+        embeddings = np.full((len(rows), dim), np.nan, dtype=np.float32)
+        failed = 0
+        for i, row in enumerate(rows):
+            if row is None or len(row) == 0 or len(row) != dim:
+                failed += 1
+            else:
+                embeddings[i] = row
+        if failed:
+            logger.warning(f"{failed}/{len(rows)} {kind} embeddings failed.")
         return embeddings
     
     def local_embed(self, text):
-        embedding = self.local_embedding_model.get_text_embedding(text)
-        return embedding
+        return self.batch_local_embed([text])[0]
     
-    def batch_local_embed(self, text_l):
-        embed_documents = self.local_embedding_model.get_text_embedding_batch(
-            text_l, show_progress=True
+    def _local_compute(self, texts, processes:int):
+        if processes > 1 and len(texts) >= EMBED_SHARD_MIN_TEXTS:
+            return list(sharded_embed(texts, processes))
+        return length_bucketed(
+            texts, lambda batch: self.local_embedding_model.get_text_embedding_batch(batch, show_progress=True)
         )
-        return embed_documents
+
+    def batch_local_embed(self, text_l, processes:int = EMBED_PROCESSES, as_array:bool = False):
+        # as_array returns a (len(text_l), dim) float32 matrix with NaN rows for failures,
+        # otherwise a list of lists with [] for failures.
+        compute = lambda texts: self._local_compute(texts, processes)
+        if self.cache is None:
+            rows = compute(text_l)
+        else:
+            # Namespaced by the model that was actually loaded (possibly the local fallback):
+            # the workers' when the call is large enough to shard, otherwise this process's.
+            if processes > 1 and len(text_l) >= EMBED_SHARD_MIN_TEXTS:
+                model_name = shard_cache_name(processes)
+            else:
+                model_name = cache_model_name(self.local_embedding_model)
+            rows = self.cache.get_or_compute(model_name, text_l, compute)
+        if as_array:
+            return self._to_matrix(rows, "local")
+        return [[] if row is None else (row.tolist() if isinstance(row, np.ndarray) else row) for row in rows]
             
\ No newline at end of file
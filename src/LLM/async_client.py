@@ -0,0 +1,91 @@
+import asyncio
+import atexit
+import contextvars
+import threading
+from typing import Optional
+import httpx
+import logging
+
+from src.LLM.rate_limiter import AdaptiveRateLimiter
+from src.configs.config import (
+    CHAT_AGENT_MAX_CONCURRENCY,
+    CHAT_AGENT_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _in_context(coro, context:contextvars.Context):
+    # Coroutines submitted from other threads see the caller's context variables (such as
+    # the ledger stage) instead of the loop thread's.
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+class AsyncRuntime:
+    def __init__(self, max_concurrency:int = CHAT_AGENT_MAX_CONCURRENCY, timeout:float = CHAT_AGENT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="chat-agent-loop", daemon=True)
+        self.thread.start()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.rate_limiter = AdaptiveRateLimiter()
+        # Futures of in-flight chat requests, keyed by endpoint + request hash, shared by
+        # every ChatAgent so identical concurrent prompts go out as one network call.
+        self.inflight = {}
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro):
+        if threading.current_thread() is self.thread:
+            coro.close()
+            raise RuntimeError("AsyncRuntime.run() called from the event loop thread; await the coroutine instead.")
+        return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), self.loop).result()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                timeout=httpx.Timeout(self.timeout),
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self):
+        if self.loop.is_running():
+            try:
+                self.run(self._aclose())
+            except Exception as e:
+                logger.debug(f"Failed to close async http client: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+def get_runtime() -> AsyncRuntime:
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AsyncRuntime()
+            atexit.register(_runtime.close)
+        return _runtime
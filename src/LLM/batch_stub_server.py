@@ -0,0 +1,174 @@
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import requests
+import logging
+
+FILE_PATH = Path(__file__).absolute()
+BASE_DIR = FILE_PATH.parent.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+logger = logging.getLogger(__name__)
+
+# Local stand-in for the OpenAI-compatible /v1/files + /v1/batches endpoints used by
+# ChatAgent.batch_api_chat. Each request is answered by forwarding it to --upstream
+# (e.g. a local vLLM server) or, without one, by echoing the prompt back.
+
+
+class BatchStubState:
+    def __init__(self, upstream:str = None, delay:float = 0.0):
+        self.upstream = upstream
+        self.delay = delay
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content:bytes, filename:str, purpose:str):
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.files[file_id] = {"content": content, "filename": filename, "purpose": purpose}
+        return {"id": file_id, "object": "file", "bytes": len(content), "filename": filename, "purpose": purpose}
+
+    def answer(self, body:dict):
+        if self.upstream:
+            response = requests.post(self.upstream, json=body)
+            return response.status_code, response.json()
+        content = body["messages"][-1]["content"]
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(content) // 4, "completion_tokens": len(content) // 4, "total_tokens": len(content) // 2},
+        }
+
+    def run_batch(self, batch_id:str):
+        batch = self.batches[batch_id]
+        time.sleep(self.delay)
+        batch["status"] = "in_progress"
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        batch["request_counts"]["total"] = len([l for l in lines if l.strip()])
+        output = []
+        for line in lines:
+            if batch["status"] == "cancelling":
+                break
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            try:
+                status_code, body = self.answer(record["body"])
+                output.append({"id": uuid.uuid4().hex, "custom_id": record["custom_id"], "response": {"status_code": status_code, "body": body}, "error": None})
+                batch["request_counts"]["completed" if status_code == 200 else "failed"] += 1
+            except Exception as e:
+                output.append({"id": uuid.uuid4().hex, "custom_id": record["custom_id"], "response": None, "error": {"message": str(e)}})
+                batch["request_counts"]["failed"] += 1
+        content = "".join(json.dumps(o) + "\n" for o in output).encode("utf-8")
+        batch["output_file_id"] = self.add_file(content, f"{batch_id}_output.jsonl", "batch_output")["id"]
+        batch["status"] = "cancelled" if batch["status"] == "cancelling" else "completed"
+        batch["completed_at"] = int(time.time())
+
+
+def make_handler(state:BatchStubState):
+    class BatchStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send(self, code:int, payload, content_type:str = "application/json"):
+            data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            if path.endswith("/files"):
+                raw = self._body()
+                message = BytesParser(policy=default_policy).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + raw
+                )
+                fields, upload = {}, None
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    if part.get_filename():
+                        upload = (part.get_payload(decode=True), part.get_filename())
+                    else:
+                        fields[name] = part.get_content().strip()
+                if upload is None:
+                    return self._send(400, {"error": {"message": "missing file"}})
+                return self._send(200, state.add_file(upload[0], upload[1], fields.get("purpose", "")))
+            if path.endswith("/batches"):
+                request = json.loads(self._body())
+                if request.get("input_file_id") not in state.files:
+                    return self._send(404, {"error": {"message": "input file not found"}})
+                batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+                batch = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": request.get("endpoint"),
+                    "input_file_id": request["input_file_id"],
+                    "completion_window": request.get("completion_window", "24h"),
+                    "status": "validating",
+                    "output_file_id": None,
+                    "error_file_id": None,
+                    "created_at": int(time.time()),
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                }
+                state.batches[batch_id] = batch
+                threading.Thread(target=state.run_batch, args=(batch_id,), daemon=True).start()
+                return self._send(200, batch)
+            match = re.search(r"/batches/([^/]+)/cancel$", path)
+            if match and match.group(1) in state.batches:
+                state.batches[match.group(1)]["status"] = "cancelling"
+                return self._send(200, state.batches[match.group(1)])
+            if path.endswith("/chat/completions"):
+                status_code, body = state.answer(json.loads(self._body()))
+                return self._send(status_code, body)
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            match = re.search(r"/batches/([^/]+)$", path)
+            if match:
+                batch = state.batches.get(match.group(1))
+                return self._send(200, batch) if batch else self._send(404, {"error": {"message": "batch not found"}})
+            match = re.search(r"/files/([^/]+)/content$", path)
+            if match:
+                record = state.files.get(match.group(1))
+                return self._send(200, record["content"], "application/jsonl") if record else self._send(404, {"error": {"message": "file not found"}})
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    return BatchStubHandler
+
+
+def serve_in_thread(host:str = "127.0.0.1", port:int = 0, upstream:str = None, delay:float = 0.0):
+    server = ThreadingHTTPServer((host, port), make_handler(BatchStubState(upstream, delay)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for an OpenAI-compatible batch API.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--upstream", type=str, default=None, help="chat/completions url to forward batch requests to; echo prompts if omitted.")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds each batch stays in validating state.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(BatchStubState(args.upstream, args.delay)))
+    logger.info(f"batch stub listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,283 @@
+import atexit
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.embeddings.huggingface.utils import format_query, format_text, get_pooling_mode
+import logging
+
+try:
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    HAS_ONNX = True
+except ImportError:
+    HAS_ONNX = False
+
+from src.configs.config import (
+    DEFAULT_EMBED_ONLINE_MODEL,
+    DEFAULT_EMBED_LOCAL_MODEL,
+    EMBED_BACKEND,
+    EMBED_DEVICE,
+    EMBED_NUM_THREADS,
+    EMBED_BATCH_SIZE,
+    EMBED_MAX_LENGTH,
+    EMBED_ONNX_DIR,
+    EMBED_ONNX_QUANTIZE,
+    EMBED_SHARD_CHUNKS_PER_PROCESS,
+    EMBED_CACHE_ENABLED
+)
+from src.LLM.embedding_cache import EmbeddingCache, get_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+
+def length_bucketed(texts:List[str], encode:Callable[[List[str]], list]) -> list:
+    # Sorting by length keeps each padded batch close to its longest member; results are
+    # put back in input order.
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings = encode([texts[i] for i in order])
+    result = [None] * len(texts)
+    for i, embedding in zip(order, embeddings):
+        result[i] = embedding
+    return result
+
+
+class OnnxEmbedding(BaseEmbedding):
+    # CPU inference through ONNX Runtime, optionally with a dynamically int8-quantized
+    # graph. Pooling, normalization and query/text instructions follow HuggingFaceEmbedding.
+    max_length: int = EMBED_MAX_LENGTH
+    pooling: str = "cls"
+    quantized: bool = False
+    _model = PrivateAttr()
+    _tokenizer = PrivateAttr()
+
+    def __init__(self, model_name:str, onnx_dir = EMBED_ONNX_DIR, quantize:bool = EMBED_ONNX_QUANTIZE, num_threads:Optional[int] = EMBED_NUM_THREADS, embed_batch_size:int = EMBED_BATCH_SIZE, max_length:int = EMBED_MAX_LENGTH, **kwargs):
+        super().__init__(
+            model_name=model_name,
+            embed_batch_size=embed_batch_size,
+            max_length=max_length,
+            pooling=get_pooling_mode(model_name),
+            quantized=quantize,
+            **kwargs,
+        )
+        export_dir = Path(onnx_dir) / model_name.replace("/", "__")
+        if not (export_dir / "model.onnx").exists():
+            logger.info(f"exporting {model_name} to ONNX at {export_dir}...")
+            ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(export_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+        file_name = "model.onnx"
+        if quantize:
+            file_name = "model_quantized.onnx"
+            if not (export_dir / file_name).exists():
+                logger.info(f"quantizing {model_name} to int8...")
+                ORTQuantizer.from_pretrained(export_dir, file_name="model.onnx").quantize(
+                    save_dir=export_dir,
+                    quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=True),
+                )
+        session_options = onnxruntime.SessionOptions()
+        if num_threads:
+            session_options.intra_op_num_threads = num_threads
+        self._model = ORTModelForFeatureExtraction.from_pretrained(
+            export_dir, file_name=file_name, session_options=session_options
+        )
+        self._tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _encode(self, texts:List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.embed_batch_size):
+            inputs = self._tokenizer(
+                texts[start:start + self.embed_batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            hidden = self._model(**inputs).last_hidden_state
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.extend(pooled.astype(np.float32).tolist())
+        return embeddings
+
+    def _get_query_embedding(self, query:str):
+        return self._encode([format_query(query, self.model_name)])[0]
+
+    async def _aget_query_embedding(self, query:str):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text:str):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts:List[str]):
+        return length_bucketed([format_text(t, self.model_name) for t in texts], self._encode)
+
+
+class CachedEmbedding(BaseEmbedding):
+    # LlamaIndex embed model that serves document embeddings from the shared embedding
+    # cache; queries carry their own instruction prefix and go straight to the model.
+    _base: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, base:BaseEmbedding, cache:EmbeddingCache = None, **kwargs):
+        super().__init__(model_name=base.model_name, embed_batch_size=base.embed_batch_size, **kwargs)
+        self._base = base
+        self._cache = cache if cache is not None else get_embedding_cache()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _get_query_embedding(self, query:str):
+        return self._base.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query:str):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text:str):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        compute = lambda missing: length_bucketed(missing, self._base.get_text_embedding_batch)
+        rows = self._cache.get_or_compute(cache_model_name(self._base), texts, compute)
+        return [row.tolist() for row in rows]
+
+
+def cache_model_name(model:BaseEmbedding) -> str:
+    # Quantized vectors differ slightly from the reference model, so they get their own
+    # cache namespace.
+    if isinstance(model, OnnxEmbedding):
+        return f"onnx-int8:{model.model_name}" if model.quantized else f"onnx:{model.model_name}"
+    return model.model_name
+
+
+_models = {}
+_llamaindex_models = {}
+_models_lock = threading.Lock()
+_num_threads = EMBED_NUM_THREADS
+_threads_set = False
+
+def _load(model_name:str, backend:str) -> BaseEmbedding:
+    global _threads_set
+    if backend == "onnx":
+        if HAS_ONNX:
+            return OnnxEmbedding(model_name, num_threads=_num_threads)
+        logger.warning("onnxruntime/optimum not installed, falling back to the PyTorch embedding backend.")
+    if _num_threads and not _threads_set:
+        import torch
+        torch.set_num_threads(_num_threads)
+        _threads_set = True
+    return HuggingFaceEmbedding(
+        model_name=model_name,
+        device=EMBED_DEVICE,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        max_length=EMBED_MAX_LENGTH,
+    )
+
+def get_embed_model(model_name:Optional[str] = None, backend:str = EMBED_BACKEND) -> BaseEmbedding:
+    # One embedding model per (model, backend) for the whole process, loaded on first use. The
+    # default model falls back to DEFAULT_EMBED_LOCAL_MODEL when the online one fails to load.
+    key = (model_name or DEFAULT_EMBED_ONLINE_MODEL, backend)
+    with _models_lock:
+        if key not in _models:
+            try:
+                _models[key] = _load(key[0], backend)
+            except Exception as e:
+                if model_name is not None:
+                    raise
+                logger.info(f"{e}\n⚠加载远程嵌入模型失败，尝试加载本地嵌入模型 {DEFAULT_EMBED_LOCAL_MODEL}！")
+                _models[key] = _load(DEFAULT_EMBED_LOCAL_MODEL, backend)
+            logger.debug(f"embedding model {_models[key].model_name} loaded ({type(_models[key]).__name__}).")
+        return _models[key]
+
+def get_llamaindex_embed_model(model_name:Optional[str] = None) -> BaseEmbedding:
+    key = model_name or DEFAULT_EMBED_ONLINE_MODEL
+    base = get_embed_model(model_name)
+    with _models_lock:
+        if key not in _llamaindex_models:
+            _llamaindex_models[key] = CachedEmbedding(base) if EMBED_CACHE_ENABLED else base
+        return _llamaindex_models[key]
+
+
+def _init_shard_worker(num_threads:int, model_name:Optional[str], backend:str):
+    # Each worker owns one model with a fixed thread budget so the processes do not
+    # oversubscribe the cores; _load applies it via torch.set_num_threads or the ONNX session.
+    global _num_threads
+    _num_threads = num_threads
+    get_embed_model(model_name, backend)
+
+def _shard_model_name(args) -> str:
+    return cache_model_name(get_embed_model(*args))
+
+def _embed_shard(args) -> np.ndarray:
+    texts, model_name, backend = args
+    model = get_embed_model(model_name, backend)
+    return np.asarray(model.get_text_embedding_batch(texts), dtype=np.float32)
+
+_shard_pools = {}
+_shard_cache_names = {}
+
+def _shutdown_shard_pools():
+    with _models_lock:
+        for pool in _shard_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _shard_pools.clear()
+
+def _get_shard_pool(processes:int, model_name:Optional[str], backend:str) -> ProcessPoolExecutor:
+    # Pools are kept for the life of the process so workers load their model only once.
+    key = (processes, model_name, backend)
+    with _models_lock:
+        if key not in _shard_pools:
+            if not _shard_pools:
+                atexit.register(_shutdown_shard_pools)
+            num_threads = max(1, (os.cpu_count() or processes) // processes)
+            logger.info(f"starting {processes} embedding workers with {num_threads} threads each...")
+            _shard_pools[key] = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_shard_worker,
+                initargs=(num_threads, model_name, backend),
+            )
+        return _shard_pools[key]
+
+def shard_cache_name(processes:int, model_name:Optional[str] = None, backend:str = EMBED_BACKEND) -> str:
+    # Cache namespace of the model the workers actually loaded (which may be the local
+    # fallback), asked of a worker so the parent process never loads a model of its own.
+    key = (processes, model_name, backend)
+    with _models_lock:
+        name = _shard_cache_names.get(key)
+    if name is None:
+        name = _get_shard_pool(*key).submit(_shard_model_name, (model_name, backend)).result()
+        with _models_lock:
+            _shard_cache_names[key] = name
+    return name
+
+def sharded_embed(texts:List[str], processes:int, model_name:Optional[str] = None, backend:str = EMBED_BACKEND) -> np.ndarray:
+    # Texts are length-sorted and cut into contiguous chunks, several per worker so a slow
+    # chunk does not leave the other workers idle; rows come back in input order.
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    n_chunks = min(len(texts), processes * EMBED_SHARD_CHUNKS_PER_PROCESS)
+    bounds = np.linspace(0, len(texts), n_chunks + 1).astype(int)
+    chunks = [order[bounds[k]:bounds[k + 1]] for k in range(n_chunks)]
+    pool = _get_shard_pool(processes, model_name, backend)
+    results = pool.map(_embed_shard, [([texts[i] for i in chunk], model_name, backend) for chunk in chunks])
+    embeddings = None
+    for chunk, vectors in zip(chunks, results):
+        if embeddings is None:
+            embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        embeddings[chunk] = vectors
+    return embeddings if embeddings is not None else np.empty((0, 0), dtype=np.float32)
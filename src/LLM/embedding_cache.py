@@ -0,0 +1,147 @@
+import fcntl
+import hashlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+import numpy as np
+import logging
+
+from src.configs.config import EMBED_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class _ModelStore:
+    # One model's vectors: an append-only float32 file read through np.memmap, plus a
+    # sqlite index from text hash to row number.
+    def __init__(self, store_dir:Path):
+        self.dir = store_dir
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "vectors.f32"
+        self.lock_path = self.dir / "vectors.lock"
+        self.conn = sqlite3.connect(str(self.dir / "index.sqlite3"), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.conn.commit()
+        self._mmap: Optional[np.memmap] = None
+
+    @property
+    def dim(self) -> Optional[int]:
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return row[0] if row else None
+
+    def _rows_on_disk(self, dim:int) -> int:
+        return self.vectors_path.stat().st_size // (4 * dim) if self.vectors_path.exists() else 0
+
+    def _vectors(self, dim:int, min_rows:int) -> Optional[np.memmap]:
+        if self._mmap is None or self._mmap.shape[0] < min_rows:
+            rows = self._rows_on_disk(dim)
+            if rows == 0:
+                return None
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        return self._mmap
+
+    def lookup(self, keys:Sequence[str]) -> dict:
+        dim = self.dim
+        if dim is None or not keys:
+            return {}
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 900):
+            chunk = unique[start:start + 900]
+            found.update(self.conn.execute(
+                f"SELECT key, row FROM rows WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        if not found:
+            return {}
+        vectors = self._vectors(dim, max(found.values()) + 1)
+        if vectors is None:
+            return {}
+        return {key: np.array(vectors[row]) for key, row in found.items() if row < vectors.shape[0]}
+
+    def append(self, keys:List[str], vectors:np.ndarray):
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                dim = self.dim
+                if dim is None:
+                    dim = vectors.shape[1]
+                    self.conn.execute("INSERT INTO meta VALUES ('dim', ?)", (dim,))
+                elif dim != vectors.shape[1]:
+                    logger.warning(f"embedding dim {vectors.shape[1]} does not match cached dim {dim} in {self.dir}, not caching.")
+                    return
+                start = self._rows_on_disk(dim)
+                with open(self.vectors_path, "ab") as f:
+                    # Drop a partial row left by an interrupted write before appending.
+                    f.truncate(start * 4 * dim)
+                    f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO rows VALUES (?, ?)",
+                    [(key, start + i) for i, key in enumerate(keys)],
+                )
+                self.conn.commit()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir = EMBED_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def text_key(text:str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _store(self, model:str) -> _ModelStore:
+        if model not in self._stores:
+            self._stores[model] = _ModelStore(self.cache_dir / re.sub(r"[^A-Za-z0-9._-]+", "_", model))
+        return self._stores[model]
+
+    def get_or_compute(self, model:str, texts:Sequence[str], compute:Callable[[List[str]], Sequence]) -> List[Optional[np.ndarray]]:
+        # Only texts missing from the store are passed to `compute`, once each. Vectors that
+        # come back empty (failed requests) are returned as None and not stored.
+        keys = [self.text_key(text) for text in texts]
+        with self._lock:
+            store = self._store(model)
+            found = store.lookup(keys)
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        self.hits += len(keys) - sum(1 for key in keys if key not in found)
+        self.misses += len(missing)
+        if missing:
+            key_to_text = dict(zip(keys, texts))
+            computed = compute([key_to_text[key] for key in missing])
+            new_keys, new_vectors = [], []
+            for key, vector in zip(missing, computed):
+                if vector is None or len(vector) == 0:
+                    continue
+                found[key] = np.asarray(vector, dtype=np.float32)
+                new_keys.append(key)
+                new_vectors.append(found[key])
+            if new_vectors:
+                with self._lock:
+                    store.append(new_keys, np.stack(new_vectors))
+            logger.debug(f"embedding cache for {model}: {len(keys) - len(missing)} hits, {len(missing)} computed.")
+        return [found.get(key) for key in keys]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
@@ -0,0 +1,83 @@
+import fcntl
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+import logging
+
+from src.configs.config import (
+    CHAT_AGENT_FILE_REGISTRY_PATH,
+    CHAT_AGENT_FILE_ID_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UploadedFileRegistry:
+    def __init__(self, path = CHAT_AGENT_FILE_REGISTRY_PATH, ttl:float = CHAT_AGENT_FILE_ID_TTL):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_suffix(self.path.suffix + ".lock")
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # In-flight uploads on the chat event loop, so concurrent requests attaching
+        # the same PDF wait for one upload instead of starting their own.
+        self.inflight = {}
+
+    @staticmethod
+    def make_key(digest:str, files_url:str, purpose:str) -> str:
+        return f"{files_url}|{purpose}|{digest}"
+
+    def _locked_update(self, update):
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                records = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else {}
+                result = update(records)
+                tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+                tmp_path.write_text(json.dumps(records, indent=4), encoding="utf-8")
+                tmp_path.replace(self.path)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key:str) -> Optional[str]:
+        with self._lock:
+            if not self.path.exists():
+                return None
+            try:
+                record = json.loads(self.path.read_text(encoding="utf-8")).get(key)
+            except json.JSONDecodeError:
+                return None
+        if record is None or time.time() - record["uploaded_at"] > self.ttl:
+            return None
+        return record["file_id"]
+
+    def put(self, key:str, file_id:str, path:str):
+        def update(records):
+            records[key] = {"file_id": file_id, "path": str(path), "uploaded_at": time.time()}
+            now = time.time()
+            for k in [k for k, v in records.items() if now - v["uploaded_at"] > self.ttl]:
+                del records[k]
+        self._locked_update(update)
+
+    def invalidate(self, file_id:str):
+        def update(records):
+            stale = [k for k, v in records.items() if v["file_id"] == file_id]
+            for k in stale:
+                del records[k]
+            return len(stale)
+        if self._locked_update(update):
+            logger.info(f"Invalidated cached upload {file_id}.")
+
+
+_registry: Optional[UploadedFileRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_file_registry() -> UploadedFileRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = UploadedFileRegistry()
+        return _registry
@@ -0,0 +1,167 @@
+import ast
+import json
+import re
+from typing import Callable, Optional
+import logging
+
+try:
+    import jsonschema
+    HAS_JSONSCHEMA = True
+except ImportError:
+    HAS_JSONSCHEMA = False
+
+from src.configs.config import CHAT_AGENT_JSON_MODE
+
+logger = logging.getLogger(__name__)
+
+FENCE_PATTERN = re.compile(r"```(?:json)?", flags=re.IGNORECASE)
+TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+class JSONParseError(ValueError):
+    pass
+
+
+def _last_significant(out):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    return j
+
+def _drop_trailing_comma(out):
+    j = _last_significant(out)
+    if j >= 0 and out[j] == ",":
+        del out[j]
+
+def _insert_missing_comma(out, stack):
+    # A value that directly follows another value inside a container lost its comma.
+    j = _last_significant(out)
+    if stack and j >= 0 and (out[j] in '}]"' or out[j].isalnum()):
+        out.append(",")
+
+def repair_json(text:str) -> str:
+    text = FENCE_PATTERN.sub("", text)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise JSONParseError("no JSON object or array in response")
+    out, stack = [], []
+    in_string = escaped = False
+    for ch in text[min(starts):]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            elif ch == "\t":
+                ch = "\\t"
+            out.append(ch)
+        elif ch in "{[":
+            _insert_missing_comma(out, stack)
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack and stack[-1] == ch:
+                stack.pop()
+                out.append(ch)
+                if not stack:
+                    break
+        elif ch == '"':
+            _insert_missing_comma(out, stack)
+            in_string = True
+            out.append(ch)
+        else:
+            out.append(ch)
+    # Truncated responses: close the open string and containers.
+    if in_string:
+        out.append('"')
+    _drop_trailing_comma(out)
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _check(obj, schema:dict, path:str):
+    expected = schema.get("type")
+    if expected is not None:
+        expected_l = expected if isinstance(expected, list) else [expected]
+        if not any(
+            isinstance(obj, TYPES[t]) and not (t in ("number", "integer") and isinstance(obj, bool))
+            for t in expected_l
+        ):
+            raise JSONParseError(f"{path}: expected {expected}, got {type(obj).__name__}")
+    if "enum" in schema and obj not in schema["enum"]:
+        raise JSONParseError(f"{path}: {obj!r} not in {schema['enum']}")
+    if isinstance(obj, dict):
+        if len(obj) < schema.get("minProperties", 0):
+            raise JSONParseError(f"{path}: expected at least {schema['minProperties']} keys")
+        for key in schema.get("required", []):
+            if key not in obj:
+                raise JSONParseError(f"{path}: missing key {key!r}")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in obj:
+                _check(obj[key], sub_schema, f"{path}.{key}")
+    elif isinstance(obj, list):
+        if len(obj) < schema.get("minItems", 0):
+            raise JSONParseError(f"{path}: expected at least {schema['minItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(obj):
+                _check(item, schema["items"], f"{path}[{i}]")
+
+def validate_json(obj, schema:dict):
+    if HAS_JSONSCHEMA:
+        try:
+            jsonschema.validate(obj, schema)
+        except jsonschema.ValidationError as e:
+            raise JSONParseError(e.message) from e
+    else:
+        _check(obj, schema, "$")
+
+
+def parse_json(text:str, schema:Optional[dict] = None):
+    try:
+        obj = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        repaired = repair_json(text)
+        try:
+            obj = json.loads(repaired)
+        except json.JSONDecodeError as e:
+            try:
+                obj = ast.literal_eval(repaired)
+            except (ValueError, SyntaxError):
+                raise JSONParseError(f"unrepairable JSON: {e}") from e
+    if schema is not None:
+        validate_json(obj, schema)
+    return obj
+
+def is_valid_json(text:str, schema:Optional[dict] = None) -> bool:
+    try:
+        parse_json(text, schema)
+        return True
+    except JSONParseError as e:
+        logger.debug(f"invalid JSON response: {e}")
+        return False
+
+def json_validator(schema:Optional[dict] = None) -> Callable[[str], bool]:
+    return lambda text: is_valid_json(text, schema)
+
+
+def response_format(schema:dict) -> Optional[dict]:
+    # Provider-side JSON modes only accept an object at the root; array schemas rely on
+    # the prompt plus local repair.
+    if not CHAT_AGENT_JSON_MODE or schema.get("type") != "object":
+        return None
+    if CHAT_AGENT_JSON_MODE == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": "response", "schema": schema}}
+    return {"type": "json_object"}
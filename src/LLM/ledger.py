@@ -0,0 +1,143 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+import logging
+
+from src.configs.config import (
+    OUTPUT_DIR,
+    LLM_LEDGER_FILE,
+    LLM_TOKEN_PRICES
+)
+
+logger = logging.getLogger(__name__)
+
+# Per-context, so concurrent threads and coroutines each see their own stage; AsyncRuntime.run
+# carries the caller's context onto the chat event loop.
+_stage = contextvars.ContextVar("llm_stage", default="default")
+
+
+def estimate_cost(model:str, prompt_tokens:int, completion_tokens:int) -> float:
+    prices = LLM_TOKEN_PRICES.get(model) or LLM_TOKEN_PRICES.get(str(model).split("/")[-1])
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+class LLMLedger:
+    def __init__(self):
+        self.records = []
+        self.path: Optional[Path] = None
+        self._lock = threading.Lock()
+
+    @property
+    def stage(self) -> str:
+        return _stage.get()
+
+    def bind_task(self, task_id:str):
+        # Calls made before the first task is bound (keyword and recall stages) belong to
+        # it; binding a different task later starts a fresh ledger.
+        path = Path(OUTPUT_DIR) / task_id / LLM_LEDGER_FILE
+        with self._lock:
+            if path == self.path:
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if self.path is None:
+                with path.open("a", encoding="utf-8") as f:
+                    for record in self.records:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                self.records = []
+            self.path = path
+
+    @contextmanager
+    def stage_scope(self, name:str):
+        token = _stage.set(name)
+        try:
+            yield
+        finally:
+            _stage.reset(token)
+
+    def record(self, model:str, prompt_tokens:int = 0, completion_tokens:int = 0, latency:float = 0.0, retries:int = 0, cache_hit:bool = False, kind:str = "chat", stage:str = None):
+        record = {
+            "time": time.time(),
+            "stage": stage or self.stage,
+            "kind": kind,
+            "model": model,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "latency": round(latency, 4),
+            "retries": retries,
+            "cache_hit": cache_hit,
+            "cost": 0.0 if cache_hit else estimate_cost(model, prompt_tokens or 0, completion_tokens or 0),
+        }
+        with self._lock:
+            self.records.append(record)
+            if self.path is not None:
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def arecord(self, *args, **kwargs):
+        # The ledger file is appended under a lock, so coroutines record from a worker thread.
+        await asyncio.to_thread(self.record, *args, **kwargs)
+
+    def summary(self) -> dict:
+        with self._lock:
+            records = list(self.records)
+        stages = {}
+        for r in records:
+            s = stages.setdefault(r["stage"], {
+                "calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "retries": 0, "latency": 0.0, "max_latency": 0.0, "cost": 0.0,
+            })
+            s["calls"] += 1
+            s["cache_hits"] += int(r["cache_hit"])
+            s["prompt_tokens"] += r["prompt_tokens"]
+            s["completion_tokens"] += r["completion_tokens"]
+            s["retries"] += r["retries"]
+            s["latency"] += r["latency"]
+            s["max_latency"] = max(s["max_latency"], r["latency"])
+            s["cost"] += r["cost"]
+        return stages
+
+    def format_summary(self) -> str:
+        stages = self.summary()
+        header = f"{'stage':<12}{'calls':>7}{'cached':>8}{'prompt':>11}{'compl.':>10}{'retries':>9}{'time(s)':>10}{'max(s)':>9}{'cost($)':>10}"
+        lines = [header, "-" * len(header)]
+        total = {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0, "latency": 0.0, "max_latency": 0.0, "cost": 0.0}
+        for name, s in sorted(stages.items(), key=lambda kv: kv[1]["prompt_tokens"] + kv[1]["completion_tokens"], reverse=True):
+            lines.append(
+                f"{name:<12}{s['calls']:>7}{s['cache_hits']:>8}{s['prompt_tokens']:>11}{s['completion_tokens']:>10}"
+                f"{s['retries']:>9}{s['latency']:>10.1f}{s['max_latency']:>9.1f}{s['cost']:>10.3f}"
+            )
+            for k in total:
+                total[k] = max(total[k], s[k]) if k == "max_latency" else total[k] + s[k]
+        lines.append("-" * len(header))
+        lines.append(
+            f"{'total':<12}{total['calls']:>7}{total['cache_hits']:>8}{total['prompt_tokens']:>11}{total['completion_tokens']:>10}"
+            f"{total['retries']:>9}{total['latency']:>10.1f}{total['max_latency']:>9.1f}{total['cost']:>10.3f}"
+        )
+        return "\n".join(lines)
+
+    def print_summary(self):
+        if not self.records:
+            return
+        logger.info(f"LLM usage by stage (ledger: {self.path})\n{self.format_summary()}")
+
+
+_ledger: Optional[LLMLedger] = None
+_ledger_lock = threading.Lock()
+
+def get_ledger() -> LLMLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = LLMLedger()
+        return _ledger
+
+def llm_stage(name:str):
+    return get_ledger().stage_scope(name)
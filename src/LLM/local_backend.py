@@ -0,0 +1,136 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from tqdm import tqdm
+import logging
+
+from src.configs.config import (
+    LOCAL_BACKEND_MODE,
+    LOCAL_MODEL,
+    LOCAL_CHAT_TEMPLATE,
+    LOCAL_MAX_TOKENS,
+    LOCAL_TEMPERATURE,
+    LOCAL_BATCH_SIZE,
+    LOCAL_WORKERS,
+    LOCAL_TIMEOUT
+)
+from src.LLM.ledger import get_ledger
+
+logger = logging.getLogger(__name__)
+
+
+class LocalBackend:
+    MODES = ("completions", "generate")
+
+    def __init__(self, url:str, mode:str = LOCAL_BACKEND_MODE, model:str = LOCAL_MODEL, template:Optional[str] = LOCAL_CHAT_TEMPLATE, max_tokens:int = LOCAL_MAX_TOKENS, temperature:float = LOCAL_TEMPERATURE, batch_size:int = LOCAL_BATCH_SIZE, workers:int = LOCAL_WORKERS, timeout:float = LOCAL_TIMEOUT):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown local backend mode {mode}, expected one of {self.MODES}")
+        self.url = url
+        self.mode = mode
+        self.model = model
+        self.template = template
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        # /generate takes one prompt per request, so there each "batch" is a single prompt
+        # and throughput comes from the server batching concurrent requests.
+        self.batch_size = batch_size if mode == "completions" else 1
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max(workers, 16),
+            max_retries=Retry(
+                total=3,
+                backoff_factor=1,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=None,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.ledger = get_ledger()
+
+    def render(self, prompt:str) -> str:
+        return self.template.format(prompt=prompt) if self.template else prompt
+
+    def _post_batch(self, prompts:List[str], max_tokens:int, temperature:float) -> List[str]:
+        rendered = [self.render(p) for p in prompts]
+        payload = {"max_tokens": max_tokens, "temperature": temperature}
+        if self.model:
+            payload["model"] = self.model
+        if self.mode == "completions":
+            payload["prompt"] = rendered
+        else:
+            payload.update({"prompt": rendered[0], "n": 1})
+        start = time.monotonic()
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        latency = time.monotonic() - start
+        if response.status_code != 200:
+            logger.error(f"local chat response code: {response.status_code}\n{response.text[:500]}")
+            return [f"chat response code: {response.status_code}"] * len(prompts)
+        data = response.json()
+        if self.mode == "completions":
+            outputs = [""] * len(prompts)
+            for choice in data.get("choices", []):
+                outputs[choice.get("index", 0)] = choice.get("text", "")
+        else:
+            text = data["text"][0]
+            outputs = [text[len(rendered[0]):] if text.startswith(rendered[0]) else text]
+        usage = data.get("usage") or {}
+        self.ledger.record(
+            self.model or "local",
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens"),
+            latency,
+            kind="local",
+        )
+        return outputs
+
+    def _post_chunk(self, prompts:List[str], max_tokens:int, temperature:float) -> List[str]:
+        try:
+            return self._post_batch(prompts, max_tokens, temperature)
+        except requests.RequestException as e:
+            logger.error(f"local chat failed for {len(prompts)} prompts: {e}")
+            return [f"Error: {e}"] * len(prompts)
+
+    def generate(self, prompts:List[str], max_tokens:int = None, temperature:float = None, workers:int = None, desc:str = None) -> List[str]:
+        max_tokens = max_tokens or self.max_tokens
+        temperature = self.temperature if temperature is None else temperature
+        workers = workers or self.workers
+        chunks = [
+            list(range(i, min(i + self.batch_size, len(prompts))))
+            for i in range(0, len(prompts), self.batch_size)
+        ]
+        res_l = ["no response"] * len(prompts)
+        if len(chunks) == 1:
+            for i, text in zip(chunks[0], self._post_chunk([prompts[i] for i in chunks[0]], max_tokens, temperature)):
+                res_l[i] = text
+            return res_l
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            future_to_chunk = {
+                executor.submit(contextvars.copy_context().run, self._post_chunk, [prompts[i] for i in chunk], max_tokens, temperature): chunk
+                for chunk in chunks
+            }
+            with tqdm(total=len(prompts), desc=desc or "local inferencing...", disable=desc is None) as pbar:
+                for future in as_completed(future_to_chunk):
+                    chunk = future_to_chunk[future]
+                    for i, text in zip(chunk, future.result()):
+                        res_l[i] = text
+                    pbar.update(len(chunk))
+        return res_l
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_local_backend(url:str) -> LocalBackend:
+    with _backends_lock:
+        if url not in _backends:
+            _backends[url] = LocalBackend(url)
+        return _backends[url]
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Tuple
+import logging
+
+from src.configs.config import (
+    DEFAULT_CHATAGENT_MODEL,
+    MODEL_CONTEXT_WINDOWS,
+    DEFAULT_CONTEXT_WINDOW,
+    PROMPT_COMPLETION_RESERVE
+)
+from src.LLM.utils import cut_text_by_token, load_prompt, num_token_from_string
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PromptReport:
+    budget: int
+    prompt_tokens: int = 0
+    trimmed: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def trimmed_tokens(self) -> int:
+        return sum(self.trimmed.values())
+
+
+class PromptBuilder:
+    def __init__(self, model:str = DEFAULT_CHATAGENT_MODEL, context_window:int = None, reserve:int = PROMPT_COMPLETION_RESERVE, tokenizer_model:str = "gpt-4o-mini"):
+        self.model = model
+        self.context_window = context_window or MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+        self.budget = self.context_window - reserve
+        self.tokenizer_model = tokenizer_model
+
+    def build(self, file_path, priorities:Dict[str, int] = None, keep_tail:Iterable[str] = (), min_tokens:Dict[str, int] = None, max_tokens:Dict[str, int] = None, **fields) -> Tuple[str, PromptReport]:
+        # Fields in `max_tokens` are capped first; fields listed in `priorities` are then
+        # trimmed, lowest priority first, until the prompt fits the model budget. Every
+        # other field is passed through untouched.
+        priorities = priorities or {}
+        min_tokens = min_tokens or {}
+        max_tokens = max_tokens or {}
+        keep_tail = set(keep_tail)
+        fields = {name: str(value) for name, value in fields.items()}
+        overhead = num_token_from_string(
+            load_prompt(file_path, **{name: "" for name in fields}), self.tokenizer_model
+        )
+        sizes = {
+            name: num_token_from_string(fields[name], self.tokenizer_model)
+            for name in fields
+        }
+        total = overhead + sum(sizes.values())
+        report = PromptReport(budget=self.budget)
+        for name, cap in max_tokens.items():
+            if name in fields and sizes[name] > cap:
+                fields[name] = cut_text_by_token(
+                    fields[name], cap, self.tokenizer_model, keep_tail=name in keep_tail
+                )
+                report.trimmed[name] = sizes[name] - cap
+                sizes[name] = cap
+        overflow = total - report.trimmed_tokens - self.budget
+        for name in sorted(priorities, key=lambda k: priorities[k]):
+            if overflow <= 0:
+                break
+            if name not in fields:
+                continue
+            keep = max(min_tokens.get(name, 0), sizes[name] - overflow)
+            if keep >= sizes[name]:
+                continue
+            fields[name] = cut_text_by_token(
+                fields[name], keep, self.tokenizer_model, keep_tail=name in keep_tail
+            )
+            report.trimmed[name] = report.trimmed.get(name, 0) + sizes[name] - keep
+            overflow -= sizes[name] - keep
+
+        report.prompt_tokens = total - report.trimmed_tokens
+        if report.trimmed:
+            logger.info(
+                f"Prompt {file_path} trimmed by {report.trimmed_tokens} tokens to fit {self.budget} ({report.trimmed})."
+            )
+        if overflow > 0:
+            logger.warning(f"Prompt {file_path} still exceeds budget {self.budget} by {overflow} tokens.")
+        return load_prompt(file_path, **fields), report
@@ -0,0 +1,175 @@
+import asyncio
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import logging
+
+from src.configs.config import (
+    CHAT_AGENT_REQUESTS_PER_MINUTE,
+    CHAT_AGENT_TOKENS_PER_MINUTE
+)
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def parse_duration(value) -> Optional[float]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        number = float(value)
+        # OpenRouter-style X-RateLimit-Reset is an epoch timestamp in milliseconds.
+        if number > 1e12:
+            return max(0.0, number / 1000 - time.time())
+        if number > 1e9:
+            return max(0.0, number - time.time())
+        return max(0.0, number)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[unit] for n, unit in parts)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    MIN_SCALE = 0.1
+    BACKOFF_FACTOR = 0.5
+    RECOVERY_STEP = 0.02
+    BACKOFF_COOLDOWN = 2.0
+    DEFAULT_PAUSE = 5.0
+
+    def __init__(self, requests_per_minute:float = CHAT_AGENT_REQUESTS_PER_MINUTE, tokens_per_minute:float = CHAT_AGENT_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._last_backoff = 0.0
+        self._updated = time.monotonic()
+        self._request_budget = float(requests_per_minute or 0)
+        self._token_budget = float(tokens_per_minute or 0)
+
+    def _refill(self, now:float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            cap = self.requests_per_minute * self.scale
+            self._request_budget = min(cap, self._request_budget + elapsed * cap / 60)
+        if self.tokens_per_minute:
+            cap = self.tokens_per_minute * self.scale
+            self._token_budget = min(cap, self._token_budget + elapsed * cap / 60)
+
+    def _wait_time(self, tokens:int) -> float:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        wait = 0.0
+        if self.requests_per_minute and self._request_budget < 1:
+            wait = max(wait, (1 - self._request_budget) * 60 / (self.requests_per_minute * self.scale))
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute * self.scale)
+            if self._token_budget < tokens:
+                wait = max(wait, (tokens - self._token_budget) * 60 / (self.tokens_per_minute * self.scale))
+        if wait > 0:
+            return wait
+        if self.requests_per_minute:
+            self._request_budget -= 1
+        if self.tokens_per_minute:
+            self._token_budget -= tokens
+        return 0.0
+
+    async def acquire(self, tokens:int = 0):
+        # Every caller runs on the shared event loop, so check-and-take needs no lock.
+        while True:
+            wait = self._wait_time(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 60))
+
+    def settle(self, estimated_tokens:int, used_tokens:Optional[int]):
+        if self.tokens_per_minute and used_tokens is not None:
+            self._token_budget -= used_tokens - estimated_tokens
+
+    def pause(self, seconds:float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def on_response(self, status_code:int, headers):
+        now = time.monotonic()
+        limit = headers.get("x-ratelimit-limit-requests")
+        if limit:
+            try:
+                self.requests_per_minute = min(self.requests_per_minute or float("inf"), float(limit))
+            except ValueError:
+                pass
+        limit = headers.get("x-ratelimit-limit-tokens")
+        if limit:
+            try:
+                self.tokens_per_minute = min(self.tokens_per_minute or float("inf"), float(limit))
+            except ValueError:
+                pass
+
+        if status_code == 429 or (status_code == 503 and "retry-after" in headers):
+            self.throttled += 1
+            delay = parse_duration(headers.get("retry-after"))
+            if delay is None:
+                delay = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if delay is None:
+                delay = parse_duration(headers.get("x-ratelimit-reset"))
+            if delay is None:
+                delay = self.DEFAULT_PAUSE
+            self.pause(delay)
+            # Concurrent workers hit the same 429 burst together; shrink the rate once per burst.
+            if now - self._last_backoff > self.BACKOFF_COOLDOWN:
+                self._last_backoff = now
+                self.scale = max(self.MIN_SCALE, self.scale * self.BACKOFF_FACTOR)
+                self._request_budget = min(self._request_budget, 0.0)
+                logger.warning(f"Rate limited by provider, pausing {delay:.1f}s and scaling throughput to {self.scale:.0%}.")
+            return
+
+        if status_code == 200:
+            for remaining_key, reset_key in (
+                ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+                ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+                ("x-ratelimit-remaining", "x-ratelimit-reset"),
+            ):
+                remaining = headers.get(remaining_key)
+                if remaining is not None and remaining.strip() == "0":
+                    delay = parse_duration(headers.get(reset_key))
+                    if delay:
+                        self.pause(delay)
+            if self.scale < 1.0:
+                self.scale = min(1.0, self.scale + self.RECOVERY_STEP)
+
+    def stats(self) -> dict:
+        return {
+            "scale": self.scale,
+            "throttled": self.throttled,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+        }
+
+
+class BlockingRateLimiter(AdaptiveRateLimiter):
+    # The same budget for plain worker threads (e.g. search APIs), so check-and-take is locked.
+    def __init__(self, requests_per_minute:float, tokens_per_minute:float = 0):
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self._lock = threading.Lock()
+
+    def wait(self, tokens:int = 0):
+        while True:
+            with self._lock:
+                wait = self._wait_time(tokens)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 60))
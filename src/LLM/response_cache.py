@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+import logging
+
+from src.configs.config import (
+    CHAT_CACHE_PATH,
+    CHAT_CACHE_MAX_AGE,
+    CHAT_CACHE_MAX_BYTES
+)
+from src.LLM.utils import file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    EVICT_EVERY = 200
+    EVICT_BATCH = 256
+
+    def __init__(self, db_path = CHAT_CACHE_PATH, max_age:float = CHAT_CACHE_MAX_AGE, max_bytes:int = CHAT_CACHE_MAX_BYTES):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # A key is answered from disk at most once per process: asking again means the
+        # caller rejected that answer (retry loops, validation rounds) and wants a new one.
+        self._seen = set()
+        self._puts = 0
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, "
+            "created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+        # Running size of the table, so eviction never has to sum or sort all of it. Other
+        # processes writing the same file make it approximate; it is re-read on startup.
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.evict()
+
+    @staticmethod
+    def make_key(model:str, temperature:float, prompt:str, pdf_paths:Optional[List[str]] = None, max_tokens:Optional[int] = None, schema:Optional[dict] = None) -> str:
+        files = [file_sha256(p) for p in pdf_paths] if pdf_paths else []
+        request = {"model": model, "temperature": temperature, "prompt": prompt, "files": files}
+        if max_tokens is not None:
+            request["max_tokens"] = max_tokens
+        if schema is not None:
+            request["schema"] = schema
+        raw = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key:str) -> Optional[str]:
+        with self._lock:
+            if key in self._seen:
+                self.misses += 1
+                return None
+            self._seen.add(key)
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or time.time() - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key:str, response:str, model:str = ""):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._seen.add(key)
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._conn.commit()
+            self._bytes += size - (old[0] if old else 0)
+            self._puts += 1
+            need_evict = self._puts % self.EVICT_EVERY == 0 or self._bytes > self.max_bytes
+        if need_evict:
+            self.evict()
+
+    # SQLite calls block, so coroutines on the shared event loop go through a worker thread.
+    async def aget(self, key:str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key:str, response:str, model:str = ""):
+        await asyncio.to_thread(self.put, key, response, model)
+
+    def evict(self):
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            expired_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?", (cutoff,)
+            ).fetchone()[0]
+            expired = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            self._bytes -= expired_bytes
+            dropped = 0
+            target = int(self.max_bytes * 0.9)
+            while self._bytes > target:
+                rows = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at ASC LIMIT ?", (self.EVICT_BATCH,)
+                ).fetchall()
+                if not rows:
+                    self._bytes = 0
+                    break
+                stale = []
+                for key, size in rows:
+                    if self._bytes <= target:
+                        break
+                    stale.append((key,))
+                    self._bytes -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                dropped += len(stale)
+            self._conn.commit()
+        if expired or dropped:
+            logger.info(f"Response cache evicted {expired} expired and {dropped} least recently used entries.")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._bytes = 0
+            self._seen.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
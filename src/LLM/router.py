@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+from typing import Optional
+import logging
+
+from src.configs.config import CHAT_AGENT_BATCH_MODEL, MODEL_ROUTES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Route:
+    model: str
+    temperature: float = 0.5
+    max_tokens: Optional[int] = None
+    escalate_to: Optional[str] = None
+    batch_model: str = CHAT_AGENT_BATCH_MODEL
+
+
+def get_route(name:str) -> Route:
+    if name not in MODEL_ROUTES:
+        logger.warning(f"No model route for {name}, using default.")
+        name = "default"
+    return Route(**MODEL_ROUTES[name])
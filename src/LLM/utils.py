@@ -1,4 +1,11 @@
+import atexit
+import hashlib
+import math
+import multiprocessing as mp
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 import tiktoken
 import logging
@@ -15,17 +22,125 @@ def load_prompt(file_path, **kwargs):
         logger.error(f"Prompt template not found at {file_path}")
         return ""
     
+@lru_cache(maxsize=None)
+def get_encoding(model = "gpt-4o-mini"):
+    return tiktoken.encoding_for_model(model)
+
 def num_token_from_string(text, model = "gpt-4o-mini"):
-    encoding = tiktoken.encoding_for_model(model)
+    encoding = get_encoding(model)
     encoded_text = encoding.encode(text)
     return len(encoded_text)
 
-def cut_text_by_token(text, max_tokens, model = "gpt-4o-mini"):
+def _cut_tokens(encoding, text, encoded_text, max_tokens, keep_tail:bool = False):
+    if len(encoded_text) <= max_tokens:
+        return text
+    if keep_tail:
+        return encoding.decode(encoded_text[-max_tokens:] if max_tokens > 0 else [])
+    return encoding.decode(encoded_text[:max_tokens])
+
+def _cut_by_chars(text, max_tokens, keep_tail:bool = False):
+    if keep_tail:
+        return text[-CUT_WORD_LENGTH * max_tokens:] if max_tokens > 0 else ""
+    return text[: CUT_WORD_LENGTH * max_tokens]
+
+def cut_text_by_token(text, max_tokens, model = "gpt-4o-mini", keep_tail:bool = False):
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        encoding = get_encoding(model)
         encoded_text = encoding.encode(text)
-        cut_text = encoding.decode(encoded_text[:max_tokens])
+        cut_text = _cut_tokens(encoding, text, encoded_text, max_tokens, keep_tail)
+    except Exception as e:
+        logger.error(e)
+        cut_text = _cut_by_chars(text, max_tokens, keep_tail)
+    return cut_text
+
+def _encode_batch(encoding, texts, num_threads):
+    try:
+        return encoding.encode_batch(texts, num_threads=num_threads)
+    except ValueError:
+        # A text containing special tokens makes the whole batch fail; isolate it.
+        encoded = []
+        for text in texts:
+            try:
+                encoded.append(encoding.encode(text))
+            except ValueError as e:
+                logger.error(e)
+                encoded.append(None)
+        return encoded
+
+def _batch_num_tokens_chunk(args):
+    texts, model, num_threads = args
+    encoded = _encode_batch(get_encoding(model), texts, num_threads)
+    return [len(e) if e is not None else len(t) // CUT_WORD_LENGTH for e, t in zip(encoded, texts)]
+
+def _batch_cut_chunk(args):
+    texts, max_tokens, model, keep_tail, num_threads = args
+    try:
+        encoding = get_encoding(model)
     except Exception as e:
         logger.error(e)
-        cut_text = text[: CUT_WORD_LENGTH * max_tokens]
-    return cut_text
\ No newline at end of file
+        return [_cut_by_chars(t, max_tokens, keep_tail) for t in texts]
+    # Every byte-level BPE token covers at least one UTF-8 byte, so texts with no more bytes
+    # than max_tokens never need encoding (a character can take several tokens).
+    long_idx = [i for i, t in enumerate(texts) if len(t.encode("utf-8")) > max_tokens]
+    result = list(texts)
+    encoded = _encode_batch(encoding, [texts[i] for i in long_idx], num_threads)
+    for i, e in zip(long_idx, encoded):
+        if e is None:
+            result[i] = _cut_by_chars(texts[i], max_tokens, keep_tail)
+        else:
+            result[i] = _cut_tokens(encoding, texts[i], e, max_tokens, keep_tail)
+    return result
+
+_token_pools = {}
+_token_pools_lock = threading.Lock()
+
+def _shutdown_token_pools():
+    with _token_pools_lock:
+        for pool in _token_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _token_pools.clear()
+
+def _get_token_pool(processes:int) -> ProcessPoolExecutor:
+    # Pools live for the whole process so workers start (and load encoders) once. They are
+    # spawned rather than forked: the parent runs the chat event loop thread and HTTP pools,
+    # which a forked child could deadlock on.
+    with _token_pools_lock:
+        if processes not in _token_pools:
+            if not _token_pools:
+                atexit.register(_shutdown_token_pools)
+            _token_pools[processes] = ProcessPoolExecutor(
+                max_workers=processes, mp_context=mp.get_context("spawn")
+            )
+        return _token_pools[processes]
+
+def _run_chunked(func, texts, make_args, processes):
+    if not processes or processes <= 1 or len(texts) < 2 * processes:
+        return func(make_args(texts))
+    chunk_size = math.ceil(len(texts) / processes)
+    chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    results = _get_token_pool(processes).map(func, [make_args(chunk) for chunk in chunks])
+    return [item for chunk in results for item in chunk]
+
+def batch_num_tokens(texts, model = "gpt-4o-mini", num_threads:int = 8, processes:int = None):
+    texts = list(texts)
+    return _run_chunked(
+        _batch_num_tokens_chunk, texts, lambda chunk: (chunk, model, num_threads), processes
+    )
+
+def batch_cut_text_by_token(texts, max_tokens, model = "gpt-4o-mini", keep_tail:bool = False, num_threads:int = 8, processes:int = None):
+    texts = list(texts)
+    return _run_chunked(
+        _batch_cut_chunk, texts, lambda chunk: (chunk, max_tokens, model, keep_tail, num_threads), processes
+    )
+
+def file_sha256(path):
+    stat = os.stat(path)
+    return _file_sha256(str(path), stat.st_mtime, stat.st_size)
+
+@lru_cache(maxsize=4096)
+def _file_sha256(path, mtime, size):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -18,6 +18,7 @@ SPLITTER_CHUNK_SIZE = 2048
 SPLITTER_WINDOW_SIZE = 6
 DEFAULT_SPLITTER_TYPE = "sentence"
 MD_TEXT_LENGTH = 20000
+MD_TEXT_CUT_PROCESSES = 4
 ADVANCED_CHATAGENT_MODEL = "openai/gpt-4o-mini"
 RESOURCE_DIR = Path(f"{BASE_DIR}/resources")
 FEEDBACK_DIR = "feedback"
@@ -49,10 +50,114 @@ DEFAULT_EMBED_ONLINE_MODEL = "BAAI/bge-base-en-v1.5"
 DEFAULT_EMBED_LOCAL_MODEL = ""
 EMBED_REMOTE_URL = "https://api.siliconflow.cn/v1/embeddings"
 EMBED_TOKEN = ""
+EMBED_REMOTE_MODEL = "BAAI/bge-m3"
+EMBED_REMOTE_BATCH_SIZE = 64
+EMBED_REMOTE_BATCH_TOKENS = 16384
+EMBED_REMOTE_WORKERS = 4
+EMBED_REMOTE_MAX_RETRIES = 8
+EMBED_REMOTE_TIMEOUT = 120
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_DIR = Path(f"{CACHE_DIR}/embeddings")
+EMBED_DEVICE = None
+EMBED_NUM_THREADS = None
+EMBED_BATCH_SIZE = 32
+EMBED_MAX_LENGTH = 512
+EMBED_BACKEND = "torch"
+EMBED_ONNX_DIR = Path(f"{CACHE_DIR}/onnx")
+EMBED_ONNX_QUANTIZE = True
+EMBED_PROCESSES = 1
+EMBED_SHARD_MIN_TEXTS = 512
+EMBED_SHARD_CHUNKS_PER_PROCESS = 4
 
 # ChatAgent.py
 REMOTE_URL = "https://openrouter.ai/api/v1/chat/completions"
 LOCAL_URL = ""
 TOKEN = ""
 DEFAULT_CHATAGENT_MODEL = "openai/gpt-4o-mini"
-CHAT_AGENT_WORKERS = 4
\ No newline at end of file
+CHAT_AGENT_WORKERS = 32
+CHAT_AGENT_MAX_CONCURRENCY = 64
+CHAT_AGENT_TIMEOUT = 600
+CHAT_AGENT_REQUESTS_PER_MINUTE = 500
+CHAT_AGENT_TOKENS_PER_MINUTE = 2000000
+CHAT_AGENT_MAX_RETRIES = 8
+CHAT_AGENT_MAX_RATE_LIMIT_WAITS = 20
+CHAT_AGENT_BATCH_API_ENABLED = False
+CHAT_AGENT_BATCH_URL = "https://api.openai.com/v1/batches"
+CHAT_AGENT_BATCH_MODEL = "gpt-4o-mini"
+CHAT_AGENT_BATCH_MIN_PROMPTS = 100
+CHAT_AGENT_BATCH_POLL_INTERVAL = 30
+CHAT_AGENT_BATCH_TIMEOUT = 24 * 3600
+CHAT_AGENT_BATCH_DIR = Path(f"{CACHE_DIR}/batches")
+CHAT_AGENT_FILE_REGISTRY_PATH = Path(f"{CACHE_DIR}/uploaded_files.json")
+CHAT_AGENT_FILE_ID_TTL = 7 * 24 * 3600
+CHAT_CACHE_ENABLED = True
+CHAT_CACHE_PATH = Path(f"{CACHE_DIR}/chat_responses.sqlite3")
+CHAT_CACHE_MAX_AGE = 30 * 24 * 3600
+CHAT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# provider-side JSON mode for schema requests: "json_schema", "json_object" or "" to rely on local repair only
+CHAT_AGENT_JSON_MODE = "json_schema"
+
+# local_backend.py
+# "completions": OpenAI-compatible /v1/completions (vLLM, llama.cpp, TGI), prompts batched per request;
+# "generate": legacy vLLM /generate, one prompt per request batched server-side.
+LOCAL_BACKEND_MODE = "completions"
+LOCAL_MODEL = ""
+LOCAL_CHAT_TEMPLATE = (
+    "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n"
+    "You are a helpful AI assistant.<|eot_id|><|start_header_id|>user<|end_header_id|>\n\n"
+    "{prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
+)
+LOCAL_MAX_TOKENS = 4096
+LOCAL_TEMPERATURE = 1.0
+LOCAL_BATCH_SIZE = 32
+LOCAL_WORKERS = 4
+LOCAL_TIMEOUT = 1800
+
+# router.py
+# stage -> model, temperature, max_tokens; escalate_to is retried only for responses
+# that fail the caller's validation. batch_model (default CHAT_AGENT_BATCH_MODEL) is the
+# provider batch-API id used when the stage prefers the batch API.
+ESCALATION_CHATAGENT_MODEL = "openai/gpt-4o"
+MODEL_ROUTES = {
+    "default": {"model": DEFAULT_CHATAGENT_MODEL, "temperature": 0.5},
+    "filter": {"model": DEFAULT_CHATAGENT_MODEL, "temperature": 0.0, "max_tokens": 256, "escalate_to": ESCALATION_CHATAGENT_MODEL},
+    "paper_type": {"model": DEFAULT_CHATAGENT_MODEL, "temperature": 0.0, "max_tokens": 16, "escalate_to": ESCALATION_CHATAGENT_MODEL},
+    "attri": {"model": DEFAULT_CHATAGENT_MODEL, "temperature": 0.3, "escalate_to": ESCALATION_CHATAGENT_MODEL},
+    "mount": {"model": DEFAULT_CHATAGENT_MODEL, "temperature": 0.3, "escalate_to": ESCALATION_CHATAGENT_MODEL},
+}
+
+# prompt_builder.py
+MODEL_CONTEXT_WINDOWS = {
+    "openai/gpt-4o-mini": 128000,
+    "openai/gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 32000
+PROMPT_COMPLETION_RESERVE = 8192
+WRITTEN_CONTENT_TOKEN_LIMIT = 24000
+
+# ledger.py
+LLM_LEDGER_FILE = "llm_ledger.jsonl"
+# USD per million (prompt, completion) tokens
+LLM_TOKEN_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+# data_recaller.py
+RECALL_KMEANS_BATCH_SIZE = 1024
+RECALL_KMEANS_N_INIT = 3
+
+# data_fetcher.py
+# requests per minute per search source; 0 disables the limit (arxiv is searched locally)
+SEARCH_REQUESTS_PER_MINUTE = {
+    "google_scholar": 60,
+    "arxiv": 0,
+}
+RECALL_SEARCH_WORKERS = 8
+
+# paper_index.py
+PAPER_INDEX_FILE = "papers_index.sqlite3"
+PAPER_INDEX_TITLE_WEIGHT = 2.0
+PAPER_INDEX_MMAP_SIZE = 1 << 30
@@ -1,3 +1,4 @@
+import contextvars
 import json
 import os
 import re
@@ -24,9 +25,13 @@ from src.configs.config import(
     TASK_DIRS,
     MAINBODY_FILES,
     RELATED_WORK_SECTION_TITLE,
-    RELATED_WORK_DESCRIPTION
+    RELATED_WORK_DESCRIPTION,
+    WRITTEN_CONTENT_TOKEN_LIMIT
 )
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.json_utils import JSONParseError, json_validator, parse_json
+from src.LLM.ledger import llm_stage
+from src.LLM.prompt_builder import PromptBuilder
 from src.LLM.utils import load_prompt
 from src.modules.preprocessor.utils import parse_arguments_for_integration_test
 from src.modules.utils import clean_chat_agent_format, load_file_as_string, save_result
@@ -35,6 +40,11 @@ from src.schema.outlines import Outlines, SingleOutline
 
 logger = logging.getLogger(__name__)
 
+MOUNT_SCHEMA = {
+    "type": "array",
+    "items": {"type": "object", "required": ["section number", "key information"]},
+}
+
 class ContentGenerator(Base):
     ITER_SPAN = 10
     
@@ -43,16 +53,16 @@ class ContentGenerator(Base):
         self.outlines_path = self.task_dir / "outlines.json"
         self.work_dir = self.task_dir
         self.papers_dir = self.papers_dir
+        self.prompt_builder = PromptBuilder(model=ADVANCED_CHATAGENT_MODEL)
         
     def process_response(self, response):
-        res = clean_chat_agent_format(content=response)
         try:
-            res_dic = json.loads(res)
-            return res_dic
-        except Exception as e:
+            return parse_json(response, MOUNT_SCHEMA)
+        except JSONParseError as e:
             logger.warning(f"{str(e)}, Failed to process response {response[:100]}.")
             return None
         
+    @llm_stage("mount")
     def mount_trees_on_outlines(self, trees_path, outlines, chat_agent, GENERATE_RELATED_WORK_ONLY:bool = False, GENERATE_PROPOSAL:bool = False):
         papers = []
         for file in os.listdir(trees_path):
@@ -85,7 +95,13 @@ class ContentGenerator(Base):
         mount_l = [None] * len(papers)
         while prompts_and_index and retry < 3:
             prompts = [x[0] for x in prompts_and_index]
-            response_l = chat_agent.batch_remote_chat(prompts, desc="mouting trees on outlines...")
+            response_l = chat_agent.batch_remote_chat(
+                prompts,
+                desc="mouting trees on outlines...",
+                route="mount",
+                validator=json_validator(MOUNT_SCHEMA),
+                schema=MOUNT_SCHEMA,
+            )
             prompts_and_index_copy = []
             for response, (prompt, index) in zip(response_l, prompts_and_index):
                 ans = self.process_response(response)
@@ -180,29 +196,28 @@ class ContentGenerator(Base):
     def write_content_iteratively(self, papers, outlines, written_content, last_written, subsection_title, subsection_desc, chat_agent, GENERATE_RELATED_WORK_ONLY:bool = False, GENERATE_PROPOSAL:bool = False):
         res = "**"
         if not GENERATE_PROPOSAL:
-            prompt = load_prompt(
-                f"{BASE_DIR}/resources/LLM/prompts/content_generator/fulfill_content_iteratively.md",
-                topic=self.topic,
-                outlines=str(outlines),
-                content=written_content,
-                papers="\n\n".join(papers),
-                section_title=subsection_title,
-                section_desc=subsection_desc,
-                last_written=last_written,
-            )
+            prompt_path = f"{BASE_DIR}/resources/LLM/prompts/content_generator/fulfill_content_iteratively.md"
         else:
-            prompt = load_prompt(
-                f"{BASE_DIR}/resources/LLM/prompts/content_generator_project/fulfill_content_iteratively.md",
-                topic=self.topic,
-                outlines=str(outlines),
-                content=written_content,
-                papers="\n\n".join(papers),
-                section_title=subsection_title,
-                section_desc=subsection_desc,
-                last_written=last_written,
-            )
+            prompt_path = f"{BASE_DIR}/resources/LLM/prompts/content_generator_project/fulfill_content_iteratively.md"
+        prompt, _ = self.prompt_builder.build(
+            prompt_path,
+            priorities={"content": 0, "outlines": 1, "last_written": 2, "papers": 3},
+            keep_tail=["content"],
+            max_tokens={"content": WRITTEN_CONTENT_TOKEN_LIMIT},
+            topic=self.topic,
+            outlines=str(outlines),
+            content=written_content,
+            papers="\n\n".join(papers),
+            section_title=subsection_title,
+            section_desc=subsection_desc,
+            last_written=last_written,
+        )
         while self.contains_markdown(res) == True:
-            res = chat_agent.remote_chat(prompt, model=ADVANCED_CHATAGENT_MODEL)
+            res = chat_agent.stream_remote_chat(
+                prompt,
+                model=ADVANCED_CHATAGENT_MODEL,
+                validator=lambda text: not self.contains_markdown(text),
+            )
             res = clean_chat_agent_format(res)
             
         res = res.replace("\\subsection{Conclusion}", "")
@@ -252,7 +267,7 @@ class ContentGenerator(Base):
         pbar = tqdm(total=len(sections), desc="generating section words...")
         with ThreadPoolExecutor(max_workers=CHAT_AGENT_WORKERS) as executor:
             future_to_index = {
-                executor.submit(self.gen_single_section_words, section, chat_agent): idx
+                executor.submit(contextvars.copy_context().run, self.gen_single_section_words, section, chat_agent): idx
                 for idx, section in enumerate(sections)
             }
             for future in as_completed(future_to_index):
@@ -264,6 +279,7 @@ class ContentGenerator(Base):
         pbar.close()
         return "\n".join(sections)
     
+    @llm_stage("content")
     def content_fulfill_iter(self, paper_dir, outlines, chat_agent, mainbody_save_path, GENERATE_RELATED_WORK_ONLY:bool = False, GENERATE_PROPOSAL:bool = False):
         sec2info = self.map_section_to_papers(outlines, paper_dir)
         tqdm_bar = tqdm(
@@ -323,6 +339,7 @@ class ContentGenerator(Base):
         save_result(mainbody, mainbody_save_path)
         logger.info("content fulfill done.")
         
+    @llm_stage("content")
     def content_fulfill(self, paper_dir, outlines, chat_agent, mainbody_save_path):
         sec2info = self.map_section_to_papers(outlines, paper_dir)
         tqdm_bar = tqdm(
@@ -371,10 +388,12 @@ class ContentGenerator(Base):
         save_result("\n\n".join(mainbody), mainbody_save_path)
         logger.info("Content fulfill done.")
         
+    @llm_stage("content")
     def gen_abstract(self, mainbody_raw_path, abstract_save_path, chat_agent:ChatAgent):
         mainbody_raw = open(mainbody_raw_path, "r", encoding="utf-8").read()
-        prompt = load_prompt(
+        prompt, _ = self.prompt_builder.build(
             f"{BASE_DIR}/resources/LLM/prompts/content_generator/write_abstract.md",
+            priorities={"mainbody_raw": 0},
             topic=self.topic,
             mainbody_raw=mainbody_raw,
         )
@@ -420,6 +439,7 @@ class ContentGenerator(Base):
             
         save_result("\n".join(mainbody), mainbody_save_path)
         
+    @llm_stage("content")
     def generate_related_work_only(self):
         chat_agent = ChatAgent()
         outlines = Outlines.from_saved(self.outlines_path)
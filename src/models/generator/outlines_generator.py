@@ -20,13 +20,41 @@ from src.configs.config import(
 
 from src.configs.utils import load_latest_task_id
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.json_utils import JSONParseError, parse_json
+from src.LLM.ledger import llm_stage
 from src.LLM.utils import load_prompt
-from src.modules.utils import clean_chat_agent_format, load_papers
+from src.modules.utils import load_papers
 from src.schema.base import Base
 from src.schema.outlines import Outlines, SingleOutline
 
 logger = logging.getLogger(__name__)
 
+PRIMARY_OUTLINE_SCHEMA = {
+    "type": "object",
+    "required": ["title", "sections"],
+    "properties": {
+        "sections": {
+            "type": "array",
+            "minItems": 1,
+            "items": {"type": "object", "required": ["section title", "description"]},
+        },
+    },
+}
+PLAIN_MOUNT_SCHEMA = {
+    "type": "array",
+    "items": {"type": "object", "required": ["section number", "information"]},
+}
+SECONDARY_OUTLINE_SCHEMA = {
+    "type": "object",
+    "required": ["section title", "description", "subsections"],
+    "properties": {
+        "subsections": {
+            "type": "array",
+            "items": {"type": "object", "required": ["subsection title", "description"]},
+        },
+    },
+}
+
 class OutlinesGenerator(Base):
     def __init__(self, task_id):
         super().__init__(task_id)
@@ -46,25 +74,10 @@ class OutlinesGenerator(Base):
             )
         return json.dumps(paper_list, indent=4)
     
-    def extract_json_body(self, content):
-        stack = []
-        start = None
-        for i, char in enumerate(content):
-            if char == "{":
-                if not stack:
-                    start = i
-                stack.append(char)
-            elif char == "}":
-                if stack:
-                    stack.pop()
-                    if not stack:
-                        return json.loads(content[start : i + 1])
-        return None
-    
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_fixed(1),
-        retry=retry_if_exception_type(json.JSONDecodeError),
+        retry=retry_if_exception_type(JSONParseError),
     )
     def gen_outline_sections(self, chat_agent = ChatAgent(), GENERATE_RELATED_WORK_ONLY:bool = False, GENERATE_PROPOSAL:bool = False):
         if not GENERATE_PROPOSAL:
@@ -82,23 +95,21 @@ class OutlinesGenerator(Base):
                 topic=self.topic,
             )
         res = chat_agent.remote_chat(
-            prompt, model = ADVANCED_CHATAGENT_MODEL, temperature=0.3
+            prompt, model = ADVANCED_CHATAGENT_MODEL, temperature=0.3, schema=PRIMARY_OUTLINE_SCHEMA
         )
-        res = clean_chat_agent_format(res)
         try:
-            dic = self.extract_json_body(res)
-        except json.JSONDecodeError as e:
+            dic = parse_json(res, PRIMARY_OUTLINE_SCHEMA)
+        except JSONParseError as e:
             logger.error(f"json load failed.{e}")
             logger.error(f"Response from gpt: {res}")
-            raise json.JSONDecodeError(f"JSON decode failed: {e}")
+            raise
         return dic
     
     def check_response(self, res):
         try:
-            res = clean_chat_agent_format(content=res)
-            dic = json.loads(res)
-            return all("section number" in mount and "infomation" in mount for mount in dic)
-        except (json.JSONDecodeError, AssertionError) as e:
+            parse_json(res, PLAIN_MOUNT_SCHEMA)
+            return True
+        except JSONParseError as e:
             logger.debug(f"Invalid mount response: {e} - {res}")
             return False
         
@@ -124,10 +135,9 @@ class OutlinesGenerator(Base):
         wait=wait_fixed(1),
     )
     def write_secondary_outline(self, prompt:str, chat_agent:ChatAgent):
-        res = chat_agent.remote_chat(prompt, model = ADVANCED_CHATAGENT_MODEL)
+        res = chat_agent.remote_chat(prompt, model = ADVANCED_CHATAGENT_MODEL, schema=SECONDARY_OUTLINE_SCHEMA)
         try:
-            res = clean_chat_agent_format(res)
-            res_dic = json.loads(res)
+            res_dic = parse_json(res, SECONDARY_OUTLINE_SCHEMA)
             secondary_outline = SingleOutline.construct_primary_outline_from_dict(res_dic)
             return secondary_outline
         except Exception as e:
@@ -135,6 +145,7 @@ class OutlinesGenerator(Base):
             logger.error(f"The response is {res}")
             raise e
         
+    @llm_stage("outline")
     def run(self, GENERATE_RELATED_WORK_ONLY:bool = False, GENERATE_PROPOSAL:bool = False):
         chat_agent = ChatAgent()
         plain_outline_dic = self.gen_outline_sections(chat_agent, GENERATE_RELATED_WORK_ONLY, GENERATE_PROPOSAL)
@@ -163,13 +174,12 @@ class OutlinesGenerator(Base):
         mount_l = []
         while len(prompts) and cnt < 3:
             batch_res = chat_agent.batch_remote_chat(
-                prompts, desc="Mounting papers on primary outline..."
+                prompts, desc="Mounting papers on primary outline...", schema=PLAIN_MOUNT_SCHEMA
             )
             prompts_tmp = []
             for i, res in enumerate(batch_res):
                 if self.check_response(res):
-                    res = clean_chat_agent_format(res)
-                    mount_l.append(json.loads(res))
+                    mount_l.append(parse_json(res, PLAIN_MOUNT_SCHEMA))
                 else:
                     prompts_tmp.append(prompts[i])
             prompts = prompts_tmp
@@ -273,9 +283,8 @@ class OutlinesGenerator(Base):
         
         logger.debug(f"reorganizing outlines...")
         reorganized_outlines = chat_agent.remote_chat(
-            reorganize_prompt, model = ADVANCED_CHATAGENT_MODEL
+            reorganize_prompt, model = ADVANCED_CHATAGENT_MODEL, schema=PRIMARY_OUTLINE_SCHEMA
         )
-        reorganized_outlines = clean_chat_agent_format(reorganized_outlines)
-        final_outlines = Outlines.from_dict(dic=json.loads(reorganized_outlines))
+        final_outlines = Outlines.from_dict(dic=parse_json(reorganized_outlines, PRIMARY_OUTLINE_SCHEMA))
         final_outlines.save_to_file(self.outlines_save_path)
                     
\ No newline at end of file
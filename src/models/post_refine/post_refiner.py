@@ -6,6 +6,7 @@ import re
 from src.configs.config import OUTPUT_DIR, RESOURCE_DIR, TASK_DIRS, MAINBODY_FILES
 from src.configs.utils import load_latest_task_id
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.ledger import llm_stage
 from src.modules.latex_handler.latex_comparison_table_builder import (
     LatexComparisonTableBuilder,
 )
@@ -104,6 +105,7 @@ class PostRefiner(BaseRefiner):
             chat_agent=chat_agent,
         )
 
+    @llm_stage("tables")
     def generate_tables(self):
         try:
             self.summary_table_builder.run()
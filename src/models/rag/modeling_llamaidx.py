@@ -32,7 +32,6 @@ from llama_index.core.prompts.base import PromptTemplate
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core.schema import NodeWithScore, QueryBundle
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.llms.openai import OpenAI
 from llama_index.core import (
     load_index_from_storage,
@@ -46,8 +45,6 @@ import logging
 from src.configs.config import(
     BASE_DIR,
     OUTPUT_DIR,
-    DEFAULT_EMBED_LOCAL_MODEL,
-    DEFAULT_EMBED_ONLINE_MODEL,
     DEFAULT_LLAMAINDEX_OPENAI_MODEL,
     TOKEN,
     REMOTE_URL,
@@ -58,6 +55,7 @@ from src.configs.config import(
 )
 
 from src.configs.utils import ensure_task_dirs
+from src.LLM.embed_models import get_llamaindex_embed_model
 
 logger = logging.getLogger(__name__)
 
@@ -78,17 +76,7 @@ class LlamaIndexWrapper:
         self.vector_index_dir.mkdir(parents=True, exist_ok=True)
         
         if embed_model is None:
-            try:
-                Settings.embed_model = HuggingFaceEmbedding(
-                    model_name = DEFAULT_EMBED_ONLINE_MODEL
-                )
-            except Exception as e:
-                logger.info(
-                    f"{e}\nFailed to load embedding model {DEFAULT_EMBED_ONLINE_MODEL}, try to use local model {DEFAULT_EMBED_LOCAL_MODEL}."
-                )
-                Settings.embed_model = HuggingFaceEmbedding(
-                    model_name=DEFAULT_EMBED_LOCAL_MODEL
-                )
+            Settings.embed_model = get_llamaindex_embed_model()
         logger.debug("model loaded successfully.")
         self.embed_model = Settings.embed_model
         Settings.llm = llm_model
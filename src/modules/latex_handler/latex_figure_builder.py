@@ -1,3 +1,4 @@
+import contextvars
 import json
 import math
 import random
@@ -17,6 +18,7 @@ from src.configs.utils import load_latest_task_id
 from src.configs.config import OUTPUT_DIR
 import logging
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.ledger import llm_stage
 from src.LLM.utils import load_prompt
 from src.modules.latex_handler.utils import fuzzy_match
 from src.modules.utils import clean_chat_agent_format, load_file_as_string, save_result
@@ -62,6 +64,7 @@ class LatexFigureBuilder(BaseFigureBuilder):
         self.tree_fig_builder = TreeFigureBuilder(task_id)
         self.tiny_tree_fig_builder = TinyTreeFigureBuilder(task_id)
 
+    @llm_stage("figures")
     def run(self, mainbody_path: Path):
         try:
             self.structure_fig_builder.create_structure_figure(
@@ -440,7 +443,7 @@ class TreeFigureBuilder(BaseFigureBuilder):
         pbar = tqdm(total=len(content_l), desc="Extracting tree figure key info...")
         with ThreadPoolExecutor(max_workers=num_workers) as executor:
             future_to_index = {
-                executor.submit(self.extract_architecture, paragraph): idx
+                executor.submit(contextvars.copy_context().run, self.extract_architecture, paragraph): idx
                 for idx, paragraph in enumerate(content_l)
             }
             for future in as_completed(future_to_index):
@@ -684,7 +687,7 @@ class TinyTreeFigureBuilder(TreeFigureBuilder):
         pbar = tqdm(total=len(content_l), desc="Extracting tree figure key info...")
         with ThreadPoolExecutor(max_workers=num_workers) as executor:
             future_to_index = {
-                executor.submit(self.extract_architecture, paragraph): idx
+                executor.submit(contextvars.copy_context().run, self.extract_architecture, paragraph): idx
                 for idx, paragraph in enumerate(content_l)
             }
             for future in as_completed(future_to_index):
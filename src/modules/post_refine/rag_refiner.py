@@ -13,6 +13,7 @@ from src.configs.config import(
     MAINBODY_FILES
 )
 from src.configs.utils import load_latest_task_id, ensure_task_dirs
+from src.LLM.ledger import llm_stage
 from src.models.rag.modeling_llamaidx import Document, LlamaIndexWrapper
 from src.modules.post_refine.base_refiner import BaseRefiner
 from src.modules.utils import load_file_as_string, load_prompt, save_result
@@ -207,6 +208,7 @@ class RagRefiner(BaseRefiner):
         new_section = Paragraph.from_section(section=revised_content, no=section.no)
         return new_section, success_count_total
     
+    @llm_stage("rag_refine")
     def run(self, mainbody_path = None):
         if mainbody_path is None:
             mainbody_path = self.tmp_dir / MAINBODY_FILES["INITIAL"]
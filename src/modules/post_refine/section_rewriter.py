@@ -13,6 +13,7 @@ from src.configs.config import(
 )
 
 from src.configs.utils import load_latest_task_id, ensure_task_dirs
+from src.LLM.ledger import llm_stage
 from src.modules.utils import save_result, load_prompt, clean_chat_agent_format
 from src.modules.post_refine.base_refiner import BaseRefiner
 
@@ -397,6 +398,7 @@ class SectionRewriter(BaseRefiner):
             conclusion = new_conclusion_temp_list[0]
             return conclusion
     
+    @llm_stage("rewrite")
     def run(self, mainbody_path = None, GENERATE_RELATED_WORK_ONLY:bool = False, GENERATE_PROPOSAL:bool = False):
         if mainbody_path is None:
             mainbody_path = self.tmp_dir / MAINBODY_FILES["RAG"]
@@ -11,16 +11,22 @@ from src.configs.config import (
     OUTPUT_DIR,
     CHAT_AGENT_WORKERS,
     MD_TEXT_LENGTH,
+    MD_TEXT_CUT_PROCESSES,
     TASK_DIRS
 )
 
 from src.configs.utils import ensure_task_dirs
 from src.LLM.ChatAgent import ChatAgent
-from src.LLM.utils import cut_text_by_token, load_prompt
-from src.modules.utils import clean_chat_agent_format, load_file_as_string, sanitize_filename, save_result
+from src.LLM.json_utils import JSONParseError, json_validator, parse_json
+from src.LLM.ledger import llm_stage
+from src.LLM.utils import batch_cut_text_by_token, load_prompt
+from src.modules.utils import load_file_as_string, sanitize_filename, save_result
 
 logger = logging.getLogger(__name__)
 
+PAPER_TYPES = ["method", "benchmark", "theory", "survey"]
+ATTRI_SCHEMA = {"type": "object", "minProperties": 1}
+
 class DataCleaner:
     def __init__(self, papers: list[dict] = []):
         self.papers = papers
@@ -86,15 +92,15 @@ class DataCleaner:
         save_result("\n".join(bib_all), bib_file_save_path)
         
     def check_md_text_length(self):
-        for paper in self.papers:
-            if "md_text" not in paper:
-                continue
-            md_text = paper["md_text"]
-            paper["md_text"] = cut_text_by_token(md_text, MD_TEXT_LENGTH)
+        papers = [paper for paper in self.papers if "md_text" in paper]
+        md_texts = batch_cut_text_by_token(
+            [paper["md_text"] for paper in papers], MD_TEXT_LENGTH, processes=MD_TEXT_CUT_PROCESSES
+        )
+        for paper, md_text in zip(papers, md_texts):
+            paper["md_text"] = md_text
             
     def process_paper_type_response(self, res, paper_index):
-        kinds = ["method", "benchmark", "theory", "survey"]
-        for k in kinds:
+        for k in PAPER_TYPES:
             if k in res.lower():
                 self.papers[paper_index]["paper_type"] = k
                 return True
@@ -117,7 +123,13 @@ class DataCleaner:
         cnt = 0
         while prompts_and_index and cnt < 3:
             prompts = [x[0] for x in prompts_and_index]
-            res_l = chat_agent.batch_remote_chat(prompts, desc="getting paper type...")
+            res_l = chat_agent.batch_remote_chat(
+                prompts,
+                desc="getting paper type...",
+                prefer_batch_api=True,
+                route="paper_type",
+                validator=lambda res: any(k in res.lower() for k in PAPER_TYPES),
+            )
             prompts_and_index = [
                 (prompt, paper_index)
                 for res, (prompt, paper_index) in zip(res_l, prompts_and_index)
@@ -126,12 +138,11 @@ class DataCleaner:
             cnt += 1
             
     def process_attri_response(self, res, paper_index):
-        res = clean_chat_agent_format(content = res)
         try:
-            res_dic = json.loads(res)
+            res_dic = parse_json(res, ATTRI_SCHEMA)
             self.papers[paper_index]["attri"] = {**res_dic}
             return True
-        except Exception as e:
+        except JSONParseError as e:
             logger.debug(
                 f"Failed to process {self.papers[paper_index]['title']}; The res: {res[:100]}; {e}"
             )
@@ -149,7 +160,14 @@ class DataCleaner:
         cnt = 0
         while prompts_and_index and cnt < 3:
             prompts = [x[0] for x in prompts_and_index]
-            res_l = chat_agent.batch_remote_chat(prompts, desc="getting attribute tree from paper......")
+            res_l = chat_agent.batch_remote_chat(
+                prompts,
+                desc="getting attribute tree from paper......",
+                prefer_batch_api=True,
+                route="attri",
+                validator=json_validator(ATTRI_SCHEMA),
+                schema=ATTRI_SCHEMA,
+            )
             prompts_and_index = [
                 (prompt, paper_index)
                 for res, (prompt, paper_index) in zip(res_l, prompts_and_index)
@@ -220,6 +238,7 @@ class DataCleaner:
         self.save_papers(papers_dir)
         logger.info(f"========== {len(self.papers)} remain after cleaning. ==========")
         
+    @llm_stage("clean")
     def run(self, task_id, chat_agent: ChatAgent = None):
         task_dir = ensure_task_dirs(task_id)
         jsons_dir = task_dir / TASK_DIRS["JSONS_DIR"]
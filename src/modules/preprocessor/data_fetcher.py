@@ -2,6 +2,7 @@ from collections import Counter
 import json
 import os
 import re
+import threading
 import time
 import random
 from pathlib import Path
@@ -9,7 +10,6 @@ from urllib.parse import quote_plus, urlencode
 from typing import List, Dict, Any, Optional
 from tqdm import tqdm
 import logging
-import pickle
 import multiprocessing as mp
 
 
@@ -39,9 +39,12 @@ from src.configs.config import (
     DATASET_DIR,
     PAPERS_DIR,
     DEFAULT_DATA_FETCHER_ENABLE_CACHE,
-    SERPAPI_API_KEY
+    SERPAPI_API_KEY,
+    SEARCH_REQUESTS_PER_MINUTE
 )
 
+from src.LLM.rate_limiter import BlockingRateLimiter
+from src.modules.preprocessor.paper_index import PaperIndex
 from src.modules.utils import load_file_as_string, save_result, sanitize_filename
 
 logging.basicConfig(level=logging.DEBUG)
@@ -62,6 +65,12 @@ class DataFetcher:
         self.cache_file_path = Path(CACHE_DIR) / "key_words_cache.json"
         self.mapping_dict = self._load_mapping_dict()
         self.cache_dict = self._load_cache_dict()
+        # Searches may run concurrently; cache/mapping updates and their saves are serialized.
+        self._cache_lock = threading.RLock()
+        self.rate_limiters = {
+            source: BlockingRateLimiter(SEARCH_REQUESTS_PER_MINUTE.get(source, 0))
+            for source in AVAILABLE_DATA_SOURCES
+        }
         logger.info("1")
         self.papers_metadata = self._load_all_papers_metadata()
         logger.info("2")
@@ -100,7 +109,8 @@ class DataFetcher:
                 for data_src in AVAILABLE_DATA_SOURCES
             ])
     
-    def _read_json(self, file_path):
+    @staticmethod
+    def _read_json(file_path):
         if HAS_ORJSON:
             with open(file_path, "rb") as f:
                 return orjson.loads(f.read())
@@ -111,73 +121,80 @@ class DataFetcher:
             with open(file_path, "r", encoding="utf-8") as f:
                 return json.load(f)
     
-    def _process_batch(self, file_paths):
+    @staticmethod
+    def _process_batch(file_paths):
+        # Static so the pool pickles only the function, not the fetcher and its locks. Results
+        # are keyed by file so every file, including failed ones, can be recorded in the index.
         batch_results = {}
         for file_path in file_paths:
             try:
-                paper = self._read_json(file_path)
+                paper = DataFetcher._read_json(file_path)
+                stem = Path(file_path).stem
                 
                 if "_id" not in paper:
-                    paper["_id"] = file_path.stem
+                    paper["_id"] = stem
                 if "title" not in paper:
-                    paper["title"] = file_path.stem
+                    paper["title"] = stem
                 if "from" not in paper:
                     if "arxiv" in str(file_path).lower() or "arxiv" in str(paper.get("detail_url", "")):
                         paper["from"] = "arxiv"
                     else:
                         paper["from"] = "local"
                 
-                batch_results[paper["_id"]] = {
+                batch_results[file_path] = {
+                    "_id": paper["_id"],
                     "title": paper["title"],
                     "abstract": paper.get("abstract", ""),
-                    "from": paper["from"],
-                    "file_path": str(file_path)
+                    "from": paper["from"]
                 }
             except Exception as e:
-                batch_results[f"error_{file_path}"] = str(e)
+                batch_results[file_path] = {"error": str(e)}
         
         return batch_results
             
     def _load_all_papers_metadata(self):
-        cache_file = self.papers_dir / "papers_metadata_cache.pkl"
-        if cache_file.exists():
-            cache_mtime = cache_file.stat().st_mtime
-            try:
-                newest_json = max(self.papers_dir.glob("*.json"), key=lambda f: f.stat().st_mtime, default=None)
-                if newest_json and cache_mtime > newest_json.stat().st_mtime:
-                    start_time = time.time()
-                    with open(cache_file, "rb") as f:
-                        papers_metadata = pickle.load(f)
-                    elapsed = time.time() - start_time
-                    logger.info(f"从缓存加载了 {len(papers_metadata)} 篇论文元数据，耗时 {elapsed:.2f} 秒")
-                    return papers_metadata
-            except Exception as e:
-                logger.warning(f"检查缓存时出错: {str(e)}，将重新生成缓存")
-        
+        # Metadata lives in an on-disk SQLite store next to the JSON files; only files added or
+        # modified since the last run are parsed, and lookups go to the memory-mapped database.
         start_time = time.time()
-        
-        all_files = list(self.papers_dir.glob("*.json"))
+        self.paper_index = PaperIndex(self.papers_dir)
+        if not self.paper_index.has_fts:
+            logger.warning("SQLite未编译FTS5，arxiv关键词检索将使用线性扫描")
+        changed_files, deleted_files = self.paper_index.changed_files(self.papers_dir)
+        if deleted_files:
+            self.paper_index.remove_files(deleted_files)
+            logger.info(f"从元数据库中移除了 {len(deleted_files)} 个已删除的JSON文件")
+
+        all_files = list(changed_files)
         total_files = len(all_files)
-        logger.info(f"找到 {total_files} 个JSON文件需要处理")
+        logger.info(f"找到 {total_files} 个新增或修改的JSON文件需要处理")
         cpu_count = mp.cpu_count()
-        num_processes = max(1, min(cpu_count - 1, 16))
+        num_processes = max(1, min(cpu_count - 1, 16, total_files // 1000 + 1))
         batch_size = max(100, min(1000, total_files // (num_processes * 10)))
         batches = [all_files[i:i + batch_size] for i in range(0, len(all_files), batch_size)]
 
-        papers_metadata = {}
         error_count = 0
         processed_count = 0
 
-        with mp.Pool(num_processes) as pool:
-            for i, batch_result in enumerate(pool.imap_unordered(self._process_batch, batches)):
-                batch_errors = {k: v for k, v in batch_result.items() if k.startswith("error_")}
-                for error_key in batch_errors:
-                    file_path = error_key.replace("error_", "")
-                    logger.error(f"加载论文 {file_path} 时出错: {batch_result[error_key]}")
-                    del batch_result[error_key]
-                    error_count += 1
-                papers_metadata.update(batch_result)
-                processed_count += len(batch_result)
+        if num_processes > 1:
+            pool = mp.Pool(num_processes)
+            batch_results = pool.imap_unordered(self._process_batch, batches)
+        else:
+            pool = None
+            batch_results = map(self._process_batch, batches)
+        try:
+            for i, batch_result in enumerate(batch_results):
+                rows = []
+                for file_path, result in batch_result.items():
+                    if "error" in result:
+                        logger.error(f"加载论文 {file_path} 时出错: {result['error']}")
+                        error_count += 1
+                        # Stored without a paper id, so the file is skipped until it changes.
+                        rows.append((file_path, changed_files[file_path], None, None, None, None))
+                        continue
+                    rows.append((file_path, changed_files[file_path], result["_id"],
+                                 result["title"], result["abstract"], result["from"]))
+                    processed_count += 1
+                self.paper_index.upsert(rows)
 
                 if (i + 1) % max(1, len(batches) // 20) == 0 or (i + 1) == len(batches):
                     progress = (i + 1) / len(batches) * 100
@@ -191,19 +208,30 @@ class DataFetcher:
                             f"速度: {papers_per_second:.1f} 篇/秒 | "
                             f"已用时间: {elapsed:.1f}秒 | "
                             f"预计剩余: {remaining:.1f}秒")
-                    
-        try:
-            with open(cache_file, "wb") as f:
-                pickle.dump(papers_metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
-            logger.info(f"元数据缓存已保存至 {cache_file}")
-        except Exception as e:
-            logger.error(f"保存缓存时出错: {str(e)}")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
+        papers_metadata = self.paper_index.metadata
         total_time = time.time() - start_time
         logger.info(f"从目录 {self.papers_dir} 加载了 {len(papers_metadata)} 篇论文元数据，耗时 {total_time:.2f} 秒")
 
         return papers_metadata
-    
+
+    def _scan_metadata(self, search_word):
+        result_ids = []
+        for paper_id, metadata in self.papers_metadata.items():
+            if metadata["from"] != "arxiv":
+                continue
+            title = metadata["title"].lower()
+            abstract = metadata["abstract"].lower()
+            if search_word in title or search_word in abstract:
+                result_ids.append(paper_id)
+            if len(result_ids) >= self.SINGLE_WORD_LIMIT:
+                break
+        return result_ids
+
     def _load_paper(self, paper_id):
         if paper_id not in self.papers_metadata:
             return
@@ -388,6 +416,7 @@ class DataFetcher:
                 search_params["as_yhi"] = time_e
             
             logger.info(f"正在搜索第 {current_page + 1} 页，关键词: {key_words}")
+            self.rate_limiters["google_scholar"].wait()
             search_results = self._search_google_scholar_with_serpapi(search_params)
             
             if not search_results:
@@ -412,41 +441,42 @@ class DataFetcher:
             if not pagination.get("next"):
                 logger.info("已到达最后一页")
                 break
-
-            if current_page < page_count - 1:
-                time.sleep(1.0)
         
         logger.info(f"google_scholar: 共获取了 {len(papers)} 篇论文，关键词为 {key_words}")
 
         if self.enable_cache and papers:
-            paper_ids = []
-            for paper in papers:
-                file_id = paper["_id"]
-                paper_ids.append(file_id)
-                filename = sanitize_filename(f"{file_id}.json")
-                paper_path = self.paper_store_dir / filename
-                
-                try:
-                    save_result(json.dumps(paper, indent=4, ensure_ascii=False), paper_path)
-                    
-                    if 'title' in paper and paper['title']:
-                        self.mapping_dict["google_scholar"]["title_to_id"][paper["title"]] = file_id
-                        self.mapping_dict["google_scholar"]["id_to_title"][file_id] = paper["title"]
-                except Exception as e:
-                    logger.warning(f"保存论文失败: {e}")
-            
-            if "google_scholar" not in self.cache_dict:
-                self.cache_dict["google_scholar"] = {"kw_to_ids": {}}
-            self.cache_dict["google_scholar"]["kw_to_ids"][cache_key] = paper_ids
+            with self._cache_lock:
+                self._save_google_cache(cache_key, papers)
+        
+        return papers
+
+    def _save_google_cache(self, cache_key, papers):
+        paper_ids = []
+        for paper in papers:
+            file_id = paper["_id"]
+            paper_ids.append(file_id)
+            filename = sanitize_filename(f"{file_id}.json")
+            paper_path = self.paper_store_dir / filename
             
             try:
-                save_result(json.dumps(self.cache_dict, indent=4, ensure_ascii=False), self.cache_file_path)
-                save_result(json.dumps(self.mapping_dict, indent=4, ensure_ascii=False), self.mapping_file_path)
-                logger.debug("缓存保存成功")
+                save_result(json.dumps(paper, indent=4, ensure_ascii=False), paper_path)
+                
+                if 'title' in paper and paper['title']:
+                    self.mapping_dict["google_scholar"]["title_to_id"][paper["title"]] = file_id
+                    self.mapping_dict["google_scholar"]["id_to_title"][file_id] = paper["title"]
             except Exception as e:
-                logger.warning(f"保存缓存失败: {e}")
+                logger.warning(f"保存论文失败: {e}")
         
-        return papers
+        if "google_scholar" not in self.cache_dict:
+            self.cache_dict["google_scholar"] = {"kw_to_ids": {}}
+        self.cache_dict["google_scholar"]["kw_to_ids"][cache_key] = paper_ids
+        
+        try:
+            save_result(json.dumps(self.cache_dict, indent=4, ensure_ascii=False), self.cache_file_path)
+            save_result(json.dumps(self.mapping_dict, indent=4, ensure_ascii=False), self.mapping_file_path)
+            logger.debug("缓存保存成功")
+        except Exception as e:
+            logger.warning(f"保存缓存失败: {e}")
     
     def search_on_arxiv(self, key_words):
         key_words = key_words.split(",")
@@ -475,17 +505,10 @@ class DataFetcher:
                 return papers
         
         search_word = key_word.lower().strip()
-        result_ids = set()
-        
-        for paper_id, metadata in self.papers_metadata.items():
-            if metadata["from"] != "arxiv":
-                continue
-            title = metadata["title"].lower()
-            abstract = metadata["abstract"].lower()
-            if search_word in title or search_word in abstract:
-                result_ids.add(paper_id)
-            if len(result_ids) >= self.SINGLE_WORD_LIMIT:
-                break
+        if self.paper_index.has_fts:
+            result_ids = self.paper_index.search(search_word, source="arxiv", limit=self.SINGLE_WORD_LIMIT)
+        else:
+            result_ids = self._scan_metadata(search_word)
             
         papers = []
         for paper_id in result_ids:
@@ -498,19 +521,20 @@ class DataFetcher:
         logger.debug(f"arxiv: 获取了 {len(papers)} 篇论文，关键词为 {key_word}")
         
         if self.enable_cache:
-            self.cache_dict["arxiv"]["kw_to_ids"][key_word] = list(result_ids)
-            for paper in papers:
-                file_id = paper["_id"]
-                file_title = paper.get("title", "")
-                self.mapping_dict["arxiv"]["title_to_id"][file_title] = file_id
-                self.mapping_dict["arxiv"]["id_to_title"][file_id] = file_title
-                filename = file_id + ".json"
-                filename = sanitize_filename(filename)
-                paper_path = self.paper_store_dir / filename
-                save_result(json.dumps(paper, indent=4), paper_path)
-            
-            save_result(json.dumps(self.cache_dict, indent=4), self.cache_file_path)
-            save_result(json.dumps(self.mapping_dict, indent=4), self.mapping_file_path)
+            with self._cache_lock:
+                self.cache_dict["arxiv"]["kw_to_ids"][key_word] = list(result_ids)
+                for paper in papers:
+                    file_id = paper["_id"]
+                    file_title = paper.get("title", "")
+                    self.mapping_dict["arxiv"]["title_to_id"][file_title] = file_id
+                    self.mapping_dict["arxiv"]["id_to_title"][file_id] = file_title
+                    filename = file_id + ".json"
+                    filename = sanitize_filename(filename)
+                    paper_path = self.paper_store_dir / filename
+                    save_result(json.dumps(paper, indent=4), paper_path)
+                
+                save_result(json.dumps(self.cache_dict, indent=4), self.cache_file_path)
+                save_result(json.dumps(self.mapping_dict, indent=4), self.mapping_file_path)
         
         return papers
     
@@ -15,6 +15,7 @@ from src.configs.config import(
 )
 
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.ledger import llm_stage
 from src.LLM.utils import load_prompt
 from src.modules.utils import load_file_as_string
 from src.models.rag.modeling_llamaidx import LlamaIndexWrapper
@@ -81,7 +82,11 @@ class DataFilter:
             for paper in papers
         ]
         responses = self.chat_agent.batch_remote_chat(
-            prompt_l=prompts, desc="batch_remote_chat for fine grained sorting..."
+            prompt_l=prompts,
+            desc="batch_remote_chat for fine grained sorting...",
+            prefer_batch_api=True,
+            route="filter",
+            validator=lambda res: re.search(r"<Answer>(.*?)</Answer>", res, re.DOTALL) is not None,
         )
         sorted_papers = []
         for res, paper in zip(responses, papers):
@@ -128,6 +133,7 @@ class DataFilter:
             result_papers.sort(key=lambda x: x.get("similarity_score", 0), reverse=True)
         return result_papers
     
+    @llm_stage("filter")
     def run(self, topic:str, coarse_grained_topk: int = COARSE_GRAINED_TOPK, min_limit: int = MIN_FILTERED_LIMIT):
         if self.feedback_manager:
             papers_to_exclude = self.feedback_manager.get_papers_to_exclude()
@@ -1,19 +1,26 @@
 import random
-from typing import Dict, List
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Tuple
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.metrics.pairwise import cosine_distances
+from scipy.sparse import csr_matrix
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics.pairwise import cosine_distances, pairwise_distances_argmin, pairwise_distances_argmin_min
 import logging
 
 from src.configs.config import (
     BASE_DIR,
     DEFAULT_ITERATION_LIMIT,
     DEFAULT_PAPER_POOL_LIMIT,
-    PAPERS_DIR
+    PAPERS_DIR,
+    RECALL_KMEANS_BATCH_SIZE,
+    RECALL_KMEANS_N_INIT,
+    RECALL_SEARCH_WORKERS
 )
 
 from src.LLM.ChatAgent import ChatAgent
 from src.LLM.EmbedAgent import EmbedAgent
+from src.LLM.ledger import llm_stage
 from src.LLM.utils import load_prompt
 from src.modules.preprocessor.data_cleaner import DataCleaner
 from src.modules.preprocessor.data_fetcher import DataFetcher
@@ -22,6 +29,128 @@ from src.configs.config import DEFAULT_DATA_FETCHER_ENABLE_CACHE
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+ARXIV_ID_PATTERN = re.compile(r"arxiv\.org/(?:abs|pdf)/([a-z\-]+/\d{7}|\d{4}\.\d{4,5})", flags=re.IGNORECASE)
+BARE_ARXIV_ID_PATTERN = re.compile(r"^([a-z\-]+/\d{7}|\d{4}\.\d{4,5})(?:v\d+)?$", flags=re.IGNORECASE)
+DOI_PATTERN = re.compile(r"\b10\.\d{4,9}/[^\s\"<>?#]+", flags=re.IGNORECASE)
+LINK_FIELDS = ("doi", "link", "pdf_link", "detail_url", "pdf_url")
+
+
+def paper_fingerprints(paper:Dict) -> List[str]:
+    # Keys under which the same work from different sources (Google Scholar, arXiv) collides.
+    # Titles need a few words so generic headings do not merge unrelated papers.
+    keys = []
+    title = " ".join(re.sub(r"[^0-9a-z]+", " ", str(paper.get("title", "")).lower()).split())
+    if len(title.split()) >= 3:
+        keys.append(f"title:{title}")
+    bare = BARE_ARXIV_ID_PATTERN.match(str(paper.get("_id", ""))) if paper.get("from") == "arxiv" else None
+    if bare:
+        keys.append(f"arxiv:{bare.group(1).lower()}")
+    for field in LINK_FIELDS:
+        value = str(paper.get(field) or "")
+        match = ARXIV_ID_PATTERN.search(value)
+        if match:
+            keys.append(f"arxiv:{match.group(1).lower()}")
+        match = DOI_PATTERN.search(value)
+        if match:
+            keys.append(f"doi:{match.group(0).lower().rstrip('.')}")
+    return list(dict.fromkeys(keys))
+
+
+class EmbeddingPool:
+    # Growable float32 matrix whose rows line up with the recaller's paper pool, plus an
+    # id -> row index. Capacity doubles on overflow so appends are amortized O(1).
+    def __init__(self, capacity:int = 1024):
+        self.capacity = capacity
+        self._data: np.ndarray = None
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, paper_id):
+        return paper_id in self.row_of
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._data is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._data[:len(self.ids)]
+
+    def append(self, ids:List[str], vectors:np.ndarray):
+        if not ids:
+            return
+        if self._data is None:
+            self._data = np.empty((max(self.capacity, len(ids)), vectors.shape[1]), dtype=np.float32)
+        size = len(self.ids)
+        if size + len(ids) > self._data.shape[0]:
+            grown = np.empty((max(2 * self._data.shape[0], size + len(ids)), self._data.shape[1]), dtype=np.float32)
+            grown[:size] = self._data[:size]
+            self._data = grown
+        self._data[size:size + len(ids)] = vectors
+        for i, paper_id in enumerate(ids):
+            self.row_of[paper_id] = size + i
+        self.ids.extend(ids)
+
+
+class IncrementalKMeans:
+    # The first call fits MiniBatchKMeans; later calls keep the centroids, seed one
+    # centroid per extra cluster at the point farthest from the existing ones, and fold
+    # only the rows added since the last call into running centroid means.
+    def __init__(self, batch_size:int = RECALL_KMEANS_BATCH_SIZE, n_init:int = RECALL_KMEANS_N_INIT, random_state:int = 42):
+        self.batch_size = batch_size
+        self.n_init = n_init
+        self.random_state = random_state
+        self.centers: np.ndarray = None
+        self.counts: np.ndarray = None
+        self.seen_rows = 0
+
+    def _fit(self, X:np.ndarray, n_clusters:int) -> np.ndarray:
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=self.batch_size,
+            n_init=self.n_init,
+            random_state=self.random_state,
+        )
+        labels = kmeans.fit_predict(X)
+        self.centers = kmeans.cluster_centers_.astype(np.float32)
+        self.counts = np.bincount(labels, minlength=n_clusters).astype(np.float64)
+        return labels
+
+    def _update(self, X:np.ndarray, n_clusters:int) -> np.ndarray:
+        new = X[self.seen_rows:]
+        source = new if len(new) else X
+        while len(self.centers) < n_clusters:
+            _, dist = pairwise_distances_argmin_min(source, self.centers)
+            self.centers = np.vstack([self.centers, source[np.argmax(dist)]])
+            self.counts = np.append(self.counts, 0.0)
+        if len(new):
+            new_labels = pairwise_distances_argmin(new, self.centers)
+            one_hot = csr_matrix(
+                (np.ones(len(new)), (new_labels, np.arange(len(new)))), shape=(len(self.centers), len(new))
+            )
+            sums = one_hot @ new.astype(np.float64)
+            added = np.bincount(new_labels, minlength=len(self.centers))
+            hit = added > 0
+            total = self.counts + added
+            self.centers[hit] = (self.centers[hit] * self.counts[hit, None] + sums[hit]) / total[hit, None]
+            self.counts = total
+        # Centroids moved, so every row is reassigned; this is one nearest-centroid pass.
+        return pairwise_distances_argmin(X, self.centers)
+
+    def fit_predict(self, X:np.ndarray, n_clusters:int) -> np.ndarray:
+        n_clusters = min(n_clusters, len(X))
+        warm = (
+            self.centers is not None
+            and self.centers.shape[1] == X.shape[1]
+            and self.seen_rows <= len(X)
+            and len(self.centers) <= n_clusters
+        )
+        labels = self._update(X, n_clusters) if warm else self._fit(X, n_clusters)
+        self.seen_rows = len(X)
+        return labels
+
+
 class DataRecaller:
     def __init__(self, topic:str, iteration_limit:int = DEFAULT_ITERATION_LIMIT, paper_pool_limit:int = DEFAULT_PAPER_POOL_LIMIT, enable_cache:bool = DEFAULT_DATA_FETCHER_ENABLE_CACHE, chat_agent:ChatAgent = None):
         logger.info("begin init recaller")
@@ -33,22 +162,46 @@ class DataRecaller:
         logger.info("Embed Agent ready")
         self.chat_agent = ChatAgent() if chat_agent is None else chat_agent
         self.paper_pool:List[Dict] = []
+        self.seen_ids = set()
+        self.fingerprint_index:Dict[str, Dict] = {}
+        # Row i of paper_embeddings belongs to paper_pool[i]; papers past the last row are
+        # waiting to be embedded.
+        self.paper_embeddings = EmbeddingPool(capacity=paper_pool_limit)
+        self.clusterer = IncrementalKMeans()
         self.keyword_pool:List[str] = []
-        self.existing_keyword_embeddings:np.ndarray = np.array(
-            self.embed_agent.batch_local_embed([topic])
-        ).astype(float)
-        
-        if not isinstance(self.existing_keyword_embeddings, np.ndarray):
-            self.existing_keyword_embeddings = np.array(
-                [self.existing_keyword_embeddings]
-            )
+        self.keyword_embedding_memo:Dict[str, np.ndarray] = {}
+        self.existing_keyword_embeddings:np.ndarray = self._embed_keywords([topic]).astype(float)
 
-    def _search_papers(self, keyword:str, page:str, time_s: str, time_e: str):
-        logger.debug(f"Searching papers on arxiv: key word={keyword}.")
-        arxiv_papers = self.data_fetcher.search_on_arxiv(key_words=keyword)
+    def _search_source(self, source:str, keyword:str, page:str, time_s:str, time_e:str):
+        if source == "arxiv":
+            logger.debug(f"Searching papers on arxiv: key word={keyword}.")
+            return self.data_fetcher.search_on_arxiv(key_words=keyword)
         logger.debug(f"Searching papers on google: key word={keyword}, page={page}, time_s={time_s}, time_e={time_e}.")
-        google_papers = self.data_fetcher.search_on_google(key_words=keyword, page=page, time_s=time_s, time_e=time_e)
-        combined_papers = google_papers + arxiv_papers
+        return self.data_fetcher.search_on_google(key_words=keyword, page=page, time_s=time_s, time_e=time_e)
+
+    def _search_many(self, keywords:List[str], page:str, time_s:str, time_e:str) -> Iterator[Tuple[str, List[Dict]]]:
+        # Every (keyword, source) search runs concurrently; per-source rate limits live in the
+        # DataFetcher. Results are yielded as they arrive, and searches not yet started are
+        # cancelled when the caller stops iterating.
+        executor = ThreadPoolExecutor(max_workers=RECALL_SEARCH_WORKERS)
+        future_to_kw = {
+            executor.submit(self._search_source, source, kw, page, time_s, time_e): kw
+            for kw in keywords
+            for source in ("google_scholar", "arxiv")
+        }
+        try:
+            for future in as_completed(future_to_kw):
+                try:
+                    papers = future.result()
+                except Exception as e:
+                    logger.error(f"Search failed for key word {future_to_kw[future]}: {e}")
+                    papers = []
+                yield future_to_kw[future], papers
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _search_papers(self, keyword:str, page:str, time_s: str, time_e: str):
+        combined_papers = [paper for _, papers in self._search_many([keyword], page, time_s, time_e) for paper in papers]
         logger.debug(f"Total papers retrieved from google scholar & arxiv: {len(combined_papers)}")
         return combined_papers
     
@@ -57,14 +210,43 @@ class DataRecaller:
         dc = DataCleaner(new_papers)
         valid_papers = dc.quick_check()
         logger.debug(f"Papers after filtering empty fields: {len(valid_papers)}")
-        existing_ids = {paper["_id"] for paper in self.paper_pool}
-        unique_papers = [paper for paper in valid_papers if paper["_id"] not in existing_ids]
-        logger.debug(f"Papers after deduplication: {len(unique_papers)}")
+        unique_papers = []
+        merged = 0
+        for paper in valid_papers:
+            if len(self.paper_pool) + len(unique_papers) >= self.paper_pool_limit:
+                break
+            if paper["_id"] in self.seen_ids:
+                continue
+            self.seen_ids.add(paper["_id"])
+            keys = paper_fingerprints(paper)
+            existing = next((self.fingerprint_index[k] for k in keys if k in self.fingerprint_index), None)
+            if existing is not None:
+                # Same work from another source: keep the pooled copy and fill its gaps.
+                for field, value in paper.items():
+                    if value and not existing.get(field):
+                        existing[field] = value
+                for k in keys:
+                    self.fingerprint_index.setdefault(k, existing)
+                merged += 1
+                continue
+            for k in keys:
+                self.fingerprint_index[k] = paper
+            unique_papers.append(paper)
+        logger.debug(f"Papers after deduplication: {len(unique_papers)} ({merged} merged into existing papers)")
         self.paper_pool.extend(unique_papers)
         
+    def _forget_papers(self, papers):
+        # Papers dropped from the pool must not absorb later duplicates (which would vanish
+        # with them) or keep their ids blocked for other sources.
+        dropped = {id(paper) for paper in papers}
+        for paper in papers:
+            self.seen_ids.discard(paper["_id"])
+        self.fingerprint_index = {k: v for k, v in self.fingerprint_index.items() if id(v) not in dropped}
+
     def _embed_papers(self):
         logger.debug("Embedding new papers.")
-        new_papers = [paper for paper in self.paper_pool if "embedding" not in paper]
+        embedded = len(self.paper_embeddings)
+        new_papers = self.paper_pool[embedded:]
         logger.debug(f"Papers to embed: {len(new_papers)}")
 
         if not new_papers:
@@ -75,28 +257,31 @@ class DataRecaller:
             ("Title: " + paper["title"] + "\nAbstract: " + paper["abstract"])
             for paper in new_papers
         ]
-        embeddings = self.embed_agent.batch_local_embed(texts)
-        for paper, embedding in zip(new_papers, embeddings):
-            if isinstance(embedding, list) and embedding:
-                paper["embedding"] = embedding
-            else:
+        embeddings = self.embed_agent.batch_local_embed(texts, as_array=True)
+        ok = ~np.isnan(embeddings).any(axis=1) if embeddings.shape[1] else np.zeros(len(new_papers), dtype=bool)
+        if not ok.all():
+            failed = [paper for paper, good in zip(new_papers, ok) if not good]
+            for paper in failed:
                 logger.warning(f"Embedding failed for paper: '{paper.get('title', 'No Title')}'. Removing from pool.")
-                self.paper_pool.remove(paper)
+            self._forget_papers(failed)
+            new_papers = [paper for paper, good in zip(new_papers, ok) if good]
+            self.paper_pool[embedded:] = new_papers
+        self.paper_embeddings.append([paper["_id"] for paper in new_papers], embeddings[ok])
                 
     def _cluster_papers(self):
         logger.debug("Clustering papers based on embeddings.")
-        embeddings = np.array([paper["embedding"] for paper in self.paper_pool])
+        embeddings = self.paper_embeddings.matrix
         if embeddings.size == 0:
             logger.warning("No embeddings available for clustering.")
             return []
         
         num_clusters = len(self.keyword_pool) + 1
         logger.debug(f"Number of clusters to form: {num_clusters}")
-        kmeans = KMeans(n_clusters=num_clusters, random_state=42)
-        labels = kmeans.fit_predict(embeddings)
-        clusters = [[] for _ in range(num_clusters)]
+        labels = self.clusterer.fit_predict(embeddings, num_clusters)
+        clusters = [[] for _ in range(labels.max() + 1)]
         for label, paper in zip(labels, self.paper_pool):
             clusters[label].append(paper)
+        clusters = [cluster for cluster in clusters if cluster]
             
         logger.debug("Clustering completed.")
         return clusters
@@ -130,29 +315,42 @@ class DataRecaller:
         logger.debug(f"Generated keywords: {generated_keywords}")
         return generated_keywords
     
+    def _embed_keywords(self, keywords:List[str]) -> np.ndarray:
+        missing = list(dict.fromkeys(kw for kw in keywords if kw not in self.keyword_embedding_memo))
+        if missing:
+            embeddings = self.embed_agent.batch_local_embed(missing, as_array=True)
+            for kw, embedding in zip(missing, embeddings):
+                if not np.isnan(embedding).any():
+                    self.keyword_embedding_memo[kw] = embedding
+        return np.array([self.keyword_embedding_memo[kw] for kw in keywords if kw in self.keyword_embedding_memo])
+
+    @staticmethod
+    def _combined_ranks(avg_distances:np.ndarray, max_distances:np.ndarray) -> np.ndarray:
+        # Position of each candidate in both orderings via inverse permutations: prefer a
+        # large weighted-average distance and a small maximum distance.
+        n = len(avg_distances)
+        avg_pos = np.empty(n, dtype=np.int64)
+        avg_pos[avg_distances.argsort()[::-1]] = np.arange(n)
+        max_pos = np.empty(n, dtype=np.int64)
+        max_pos[max_distances.argsort()] = np.arange(n)
+        return (avg_pos + max_pos) / 2
+
     def _select_new_keyword(self, generated_keywords):
         logger.debug("Selecting a new keyword from generated keywords.")
+        generated_keywords = list(dict.fromkeys(generated_keywords))
+        keyword_embeddings = self._embed_keywords(generated_keywords).astype(float)
+        generated_keywords = [kw for kw in generated_keywords if kw in self.keyword_embedding_memo]
         if not generated_keywords:
             logger.warning("No generated keywords to select from.")
             return ""
-        keyword_embeddings = np.array(
-            self.embed_agent.batch_local_embed(generated_keywords)
-        ).astype(float)
         distances = cosine_distances(
             keyword_embeddings, self.existing_keyword_embeddings
         )
         weights = np.ones(self.existing_keyword_embeddings.shape[0])
         weights[0] = 2
-        avg_distances = np.average(distances, axis=1, weights=weights)
+        avg_distances = distances @ weights / weights.sum()
         max_distances = distances.max(axis=1)
-        avg_rank = avg_distances.argsort()[::-1]
-        max_rank = max_distances.argsort()
-        combined_ranks = []
-        for i in range(len(generated_keywords)):
-            combined_rank = (
-                np.where(avg_rank==i)[0][0] + np.where(max_rank==i)[0][0]
-            ) / 2
-            combined_ranks.append(combined_rank)
+        combined_ranks = self._combined_ranks(avg_distances, max_distances)
             
         selected_index = np.argmin(combined_ranks)
         new_keyword = generated_keywords[selected_index]
@@ -167,18 +365,20 @@ class DataRecaller:
     
     def _deal_init_keywords(self, key_words:str, page:str, time_s:str, time_e:str):
         key_words = key_words.split(",")
-        for kw in key_words:
-            logger.info(f"Begin Search with key word:{kw}")
-            new_papers = self._search_papers(kw, page, time_s, time_e)
+        logger.info(f"Begin Search with key words:{key_words}")
+        searched = set()
+        for kw, new_papers in self._search_many(key_words, page, time_s, time_e):
+            searched.add(kw)
             self._clean_paper_pool(new_papers)
-            self.keyword_pool.append(kw)
             if len(self.paper_pool) >= self.paper_pool_limit:
                 logger.info(
                     f"Reached paper pool limit of {self.paper_pool_limit}. Stopping recalling."
                 )
                 break
+        self.keyword_pool.extend(kw for kw in key_words if kw in searched)
         logger.info(f"Initialized keywords retrieved  {len(self.paper_pool)} papers.")
         
+    @llm_stage("recall")
     def _recall_papers_iterative(self, key_word:str, page:str, time_s:str, time_e:str):
         self._deal_init_keywords(key_word, 5, time_s, time_e)
         for iteration in range(1, self.iteration_limit + 1):
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+from src.configs.config import (
+    PAPER_INDEX_FILE,
+    PAPER_INDEX_TITLE_WEIGHT,
+    PAPER_INDEX_MMAP_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _has_fts5() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(a)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+HAS_FTS5 = _has_fts5()
+
+
+class PaperMetadata(Mapping):
+    # Read-only dict view (paper id -> {"title", "abstract", "from", "file_path"}) over the
+    # store, so metadata is read from the memory-mapped database on demand instead of being
+    # unpickled into RAM for the whole corpus.
+    PAGE_SIZE = 5000
+
+    def __init__(self, index:"PaperIndex"):
+        self.index = index
+
+    @staticmethod
+    def _to_dict(row) -> Dict:
+        return {"title": row[0], "abstract": row[1], "from": row[2], "file_path": row[3]}
+
+    def __getitem__(self, paper_id):
+        row = self.index.query_one(
+            "SELECT title, abstract, source, file_path FROM papers WHERE paper_id = ? ORDER BY rowid DESC LIMIT 1",
+            (paper_id,),
+        )
+        if row is None:
+            raise KeyError(paper_id)
+        return self._to_dict(row)
+
+    def __contains__(self, paper_id):
+        return self.index.query_one("SELECT 1 FROM papers WHERE paper_id = ? LIMIT 1", (paper_id,)) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([row[0] for row in self.index.query_all("SELECT DISTINCT paper_id FROM papers WHERE paper_id IS NOT NULL ORDER BY paper_id")])
+
+    def __len__(self):
+        return self.index.query_one("SELECT COUNT(DISTINCT paper_id) FROM papers")[0]
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        # Streamed in rowid pages so a full scan never materializes the corpus. Only the latest
+        # row of each paper id is yielded, matching __getitem__ and __len__.
+        last = 0
+        while True:
+            rows = self.index.query_all(
+                "SELECT rowid, paper_id, title, abstract, source, file_path FROM papers WHERE rowid > ? AND paper_id IS NOT NULL "
+                "AND rowid = (SELECT MAX(rowid) FROM papers AS latest WHERE latest.paper_id = papers.paper_id) "
+                "ORDER BY rowid LIMIT ?",
+                (last, self.PAGE_SIZE),
+            )
+            if not rows:
+                return
+            for row in rows:
+                yield row[1], self._to_dict(row[2:])
+            last = rows[-1][0]
+
+
+class PaperIndex:
+    # On-disk paper metadata store (one row per JSON file, with its mtime for incremental
+    # refreshes) plus an inverted index over titles and abstracts (SQLite FTS5 external-content
+    # table, porter-stemmed) ranked with BM25.
+    def __init__(self, index_dir:Path, file_name:str = PAPER_INDEX_FILE):
+        self.path = Path(index_dir) / file_name
+        self.conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA mmap_size={int(PAPER_INDEX_MMAP_SIZE)}")
+        self.has_fts = HAS_FTS5
+        self._lock = threading.RLock()
+        self._init_schema()
+        self.metadata = PaperMetadata(self)
+
+    def _init_schema(self):
+        schema = """
+            CREATE TABLE IF NOT EXISTS papers (
+                rowid INTEGER PRIMARY KEY,
+                file_path TEXT UNIQUE,
+                mtime REAL,
+                paper_id TEXT,
+                title TEXT,
+                abstract TEXT,
+                source TEXT
+            );
+            CREATE INDEX IF NOT EXISTS papers_paper_id ON papers (paper_id);
+            """
+        if self.has_fts:
+            schema += """
+            CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                title, abstract, content='papers', content_rowid='rowid', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+                INSERT INTO papers_fts (rowid, title, abstract) VALUES (new.rowid, new.title, new.abstract);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+                INSERT INTO papers_fts (papers_fts, rowid, title, abstract) VALUES ('delete', old.rowid, old.title, old.abstract);
+            END;
+            """
+        self.conn.executescript(schema)
+        self.conn.commit()
+
+    def query_one(self, sql:str, params:tuple = ()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def query_all(self, sql:str, params:tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def changed_files(self, papers_dir:Path) -> Tuple[Dict[str, float], List[str]]:
+        # Returns {path: mtime} for JSON files that are new or modified since they were stored,
+        # and the stored paths whose files are gone.
+        known = dict(self.query_all("SELECT file_path, mtime FROM papers"))
+        current = {}
+        with os.scandir(papers_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.is_file():
+                    current[entry.path] = entry.stat().st_mtime
+        changed = {path: mtime for path, mtime in current.items() if known.get(path) != mtime}
+        deleted = [path for path in known if path not in current]
+        return changed, deleted
+
+    def upsert(self, rows:Iterable[Tuple[str, float, Optional[str], Optional[str], Optional[str], Optional[str]]]):
+        # rows: (file_path, mtime, paper_id, title, abstract, source); files that failed to
+        # parse are stored with a null paper id so they are not re-read until they change.
+        rows = list(rows)
+        with self._lock:
+            self.conn.executemany("DELETE FROM papers WHERE file_path = ?", [(row[0],) for row in rows])
+            self.conn.executemany(
+                "INSERT INTO papers (file_path, mtime, paper_id, title, abstract, source) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def remove_files(self, file_paths:Iterable[str]):
+        with self._lock:
+            self.conn.executemany("DELETE FROM papers WHERE file_path = ?", [(path,) for path in file_paths])
+            self.conn.commit()
+
+    @staticmethod
+    def to_query(keyword:str) -> Optional[str]:
+        # The keyword is matched as one phrase; quoting keeps FTS operators in user text inert.
+        keyword = " ".join(keyword.split())
+        if not keyword:
+            return None
+        return '"' + keyword.replace('"', '""') + '"'
+
+    def search(self, keyword:str, source:Optional[str] = None, limit:int = 1000) -> List[str]:
+        query = self.to_query(keyword)
+        if query is None:
+            return []
+        sql = (
+            "SELECT papers.paper_id FROM papers_fts JOIN papers ON papers.rowid = papers_fts.rowid "
+            "WHERE papers_fts MATCH ?"
+        )
+        params = [query]
+        if source is not None:
+            sql += " AND papers.source = ?"
+            params.append(source)
+        sql += f" ORDER BY bm25(papers_fts, {float(PAPER_INDEX_TITLE_WEIGHT)}, 1.0) LIMIT ?"
+        params.append(limit)
+        return list(dict.fromkeys(row[0] for row in self.query_all(sql, tuple(params))))
@@ -18,6 +18,7 @@ from src.configs.config import (
 
 from src.configs.utils import ensure_task_dirs
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.ledger import get_ledger, llm_stage
 from src.LLM.utils import load_prompt
 from src.modules.preprocessor.data_recaller import DataRecaller
 from src.modules.preprocessor.data_cleaner import DataCleaner
@@ -47,6 +48,7 @@ def process_pdf_files(pdf_paths, topic):
     processed_papers = process_pdf_files_with_mineru(pdf_paths, topic, output_dir, download_dir)
     return processed_papers
 
+@llm_stage("keywords")
 def generate_initial_keywords(topic, pdf_papers=None, chat_agent=None, description=None):
     if not pdf_papers and not description:
         return None
@@ -98,6 +100,7 @@ def single_preprocessing(args:ArgsNamespace):
     tmp_config = create_tmp_config(args.title, args.key_words)
     topic = tmp_config["topic"]
     task_id = tmp_config["task_id"]
+    get_ledger().bind_task(task_id)
     
     description = None
     if hasattr(args, 'description') and args.description:
@@ -17,6 +17,7 @@ from src.configs.config import (
     MIN_FILTERED_LIMIT
 )
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.ledger import get_ledger
 from src.LLM.utils import load_prompt
 from src.configs.utils import load_latest_task_id, ensure_task_dirs
 from src.modules.utils import load_file_as_string, save_result, str2bool
@@ -82,6 +83,8 @@ def reloop_execution(task_id: Optional[str] = None,
     logger.info(f"准备重新执行任务: {task_id}")
 
     task_dir = ensure_task_dirs(task_id)
+    ledger = get_ledger()
+    ledger.bind_task(task_id)
     config_path = task_dir / "tmp_config.json"
     try:
         config = json.loads(load_file_as_string(config_path))
@@ -193,6 +196,7 @@ def reloop_execution(task_id: Optional[str] = None,
     logger.info(f"第 {iteration} 轮迭代完成")
     logger.info(f"PDF输出位置: {task_dir}/survey.pdf")
     logger.info("如需进一步调整，请再次运行reloop.py并提供新的反馈")
+    ledger.print_summary()
 
 if __name__ == "__main__":
     args = parse_arguments_for_reloop()
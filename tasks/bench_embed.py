@@ -0,0 +1,77 @@
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+FILE_PATH = Path(__file__).absolute()
+BASE_DIR = FILE_PATH.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from src.configs.config import DEFAULT_EMBED_ONLINE_MODEL, EMBED_BATCH_SIZE, EMBED_MAX_LENGTH
+from src.LLM.embed_models import HAS_ONNX, OnnxEmbedding, length_bucketed
+
+
+def load_texts(path, n):
+    if path is None:
+        random.seed(0)
+        words = "retrieval augmented generation survey language model embedding benchmark graph neural network attention transformer agent reasoning".split()
+        return [" ".join(random.choices(words, k=random.randint(20, 300))) for _ in range(n)]
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                line = f"{item.get('title', '')} {item.get('abstract', '')}".strip()
+            texts.append(line)
+    return texts[:n]
+
+def run(name, model, texts, bucketed):
+    encode = model.get_text_embedding_batch
+    start = time.perf_counter()
+    embeddings = length_bucketed(texts, encode) if bucketed else encode(texts)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24}{len(texts) / elapsed:>12.1f} texts/s{elapsed:>10.1f}s")
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def nearest(embeddings):
+    sim = embeddings @ embeddings.T
+    np.fill_diagonal(sim, -np.inf)
+    return np.argmax(sim, axis=1)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Compare local embedding backends.")
+    parser.add_argument("--model", type=str, default=DEFAULT_EMBED_ONLINE_MODEL)
+    parser.add_argument("--input", type=str, default=None, help="text file (one text per line) or jsonl with title/abstract")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--batch_size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    texts = load_texts(args.input, args.n)
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+    print(f"{len(texts)} texts, model {args.model}, batch size {args.batch_size}")
+    reference = HuggingFaceEmbedding(model_name=args.model, device="cpu", embed_batch_size=args.batch_size, max_length=EMBED_MAX_LENGTH)
+    ref = run("torch", reference, texts, bucketed=False)
+    run("torch (bucketed)", reference, texts, bucketed=True)
+    if not HAS_ONNX:
+        print("onnxruntime/optimum not installed, skipping ONNX backends.")
+        sys.exit(0)
+    for quantize in (False, True):
+        name = "onnx int8" if quantize else "onnx fp32"
+        model = OnnxEmbedding(args.model, quantize=quantize, num_threads=args.threads, embed_batch_size=args.batch_size)
+        emb = run(f"{name} (bucketed)", model, texts, bucketed=True)
+        cosine = (emb * ref).sum(axis=1)
+        top1 = (nearest(emb) == nearest(ref)).mean() if len(texts) <= 5000 else float("nan")
+        print(f"{'':<24}cosine vs torch: mean {cosine.mean():.5f}, min {cosine.min():.5f}, nearest-neighbour agreement {top1:.3f}")
@@ -0,0 +1,58 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from sklearn.cluster import KMeans
+
+FILE_PATH = Path(__file__).absolute()
+BASE_DIR = FILE_PATH.parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from src.modules.preprocessor.data_recaller import IncrementalKMeans
+
+
+def make_pool(n, dim, n_topics, seed=0):
+    # Normalized points around random topic directions, like embedded abstracts.
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim))
+    points = topics[rng.integers(0, n_topics, n)] + 0.8 * rng.standard_normal((n, dim))
+    points /= np.linalg.norm(points, axis=1, keepdims=True)
+    return points.astype(np.float32)
+
+def inertia(X, labels):
+    total = 0.0
+    for label in np.unique(labels):
+        members = X[labels == label]
+        total += ((members - members.mean(axis=0)) ** 2).sum()
+    return total
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Recall clustering wall time vs. paper pool size.")
+    parser.add_argument("--sizes", type=str, default="1000,2000,5000,10000,20000,50000")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--skip_full_above", type=int, default=50000, help="skip the from-scratch KMeans baseline above this size")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    X = make_pool(max(sizes), args.dim, args.topics)
+    clusterer = IncrementalKMeans()
+    print(f"{'papers':>8}{'clusters':>10}{'KMeans(s)':>12}{'incremental(s)':>16}{'inertia ratio':>15}")
+    # One recall iteration per size: the pool grows and one keyword (cluster) is added.
+    for iteration, n in enumerate(sizes):
+        n_clusters = iteration + 2
+        pool = X[:n]
+        start = time.perf_counter()
+        labels = clusterer.fit_predict(pool, n_clusters)
+        incremental = time.perf_counter() - start
+        if n <= args.skip_full_above:
+            start = time.perf_counter()
+            full_labels = KMeans(n_clusters=n_clusters, random_state=42).fit_predict(pool)
+            full = time.perf_counter() - start
+            ratio = inertia(pool, labels) / inertia(pool, full_labels)
+            print(f"{n:>8}{n_clusters:>10}{full:>12.2f}{incremental:>16.2f}{ratio:>15.3f}")
+        else:
+            print(f"{n:>8}{n_clusters:>10}{'-':>12}{incremental:>16.2f}{'-':>15}")
@@ -14,6 +14,7 @@ from src.models.generator.outlines_generator import OutlinesGenerator
 from src.models.generator.content_generator import ContentGenerator
 from src.models.generator.latex_generator import LatexGenerator
 from src.LLM.ChatAgent import ChatAgent
+from src.LLM.ledger import get_ledger
 from src.models.post_refine.post_refiner import PostRefiner
 from src.modules.preprocessor.preprocessor import single_preprocessing
 from src.modules.preprocessor.utils import parse_arguments_for_preprocessor
@@ -35,6 +36,8 @@ def check_latexmk_installed():
 def generate_single_survey(task_id:str, chat_agent:ChatAgent=None):
     if chat_agent is None:
         chat_agent = ChatAgent()
+    ledger = get_ledger()
+    ledger.bind_task(task_id)
  
     outline_generator = OutlinesGenerator(task_id)
     outline_generator.run()
@@ -51,6 +54,7 @@ def generate_single_survey(task_id:str, chat_agent:ChatAgent=None):
         latex_generator.compile_single_survey()
     else:
         logger.error(f"Compiling failed, as there is no latexmk installed in this machine.")
+    ledger.print_summary()
         
 if __name__ == "__main__":
     args = parse_arguments_for_preprocessor()